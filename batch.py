@@ -0,0 +1,170 @@
+"""Solving many instances in parallel, used by the batch mode of ``demo.py``.
+
+Every instance is described by a dictionary of parameters using the names of
+``demo.py``'s options: ``steps``, ``fill``, ``duration`` and ``seed`` to
+generate a schedule or ``schedule`` to load one (see ``corpus.py``), as well as
+``height`` and ``max_width``. A parameter file is a JSON list of such
+dictionaries, parameters missing there are taken from the command line.
+
+Each instance is solved in a worker process of a pool using its own
+``PackingSolver`` and time limit. The results of all instances are collected
+into a single table that is written as CSV or JSON.
+
+The ``status`` of an instance is ``optimal`` when the width is proven optimal,
+``best`` when the time limit was reached after finding a solution, ``unknown``
+when it was reached before, ``infeasible`` when the items don't fit within
+``max_width`` and ``error`` when solving raised an exception, which is then
+recorded in the ``error`` column.
+"""
+import contextlib
+import csv
+import io
+import json
+import multiprocessing
+import time
+
+from gen_instance import random_instance
+from shapes import well_known_shapes
+
+# Columns of the result table
+result_fields = [
+    'instance', 'steps', 'fill', 'duration', 'seed', 'schedule',
+    'height', 'max_width', 'items', 'status', 'width', 'lower_bound',
+    'optimal', 'encode_time', 'solve_time', 'clauses', 'variables', 'error',
+]
+
+
+def load_batch(path, defaults):
+    """Read a parameter file.
+
+    Args:
+        path: JSON file containing a list of instance parameters
+        defaults: Parameters used for values missing in the file
+
+    Returns:
+        List of the parameters of each instance
+    """
+    with open(path) as batch_file:
+        instances = json.load(batch_file)
+    return [dict(defaults, **instance) for instance in instances]
+
+
+def _solve(task):
+    index, params, solver_args, time_limit = task
+
+    result = {field: params.get(field) for field in result_fields}
+    if params.get('schedule') is not None:
+        # the generator parameters don't apply to loaded schedules
+        result.update(steps=None, fill=None, duration=None, seed=None)
+    result.update(instance=index)
+
+    try:
+        result.update(_solve_instance(params, solver_args, time_limit))
+    except Exception as error:
+        # a single broken instance shouldn't lose the results of the others
+        result.update(
+            status='error', error=f'{type(error).__name__}: {error}')
+
+    return result
+
+
+def _solve_instance(params, solver_args, time_limit):
+    from packing import PackingSolver, DeadlineExceeded
+
+    if params.get('schedule') is not None:
+        from corpus import load_schedule
+        schedule = load_schedule(params['schedule'])
+    else:
+        schedule = random_instance(
+            well_known_shapes,
+            params['steps'], params['fill'], params['duration'],
+            params.get('seed'))
+
+    start = time.monotonic()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        solver = PackingSolver(
+            schedule, params['height'], params['max_width'], **solver_args)
+
+        encoded = time.monotonic()
+        if time_limit is not None:
+            solver.deadline = encoded + time_limit
+
+        try:
+            for solution in solver.iter_solutions():
+                pass
+        except DeadlineExceeded:
+            pass
+
+    solved = time.monotonic()
+
+    if solver.lower >= solver.max_width:
+        status = 'infeasible'
+    elif solver.lower + 1 >= solver.upper:
+        status = 'optimal'
+    elif solver.upper <= solver.max_width:
+        status = 'best'
+    else:
+        status = 'unknown'
+
+    return dict(
+        items=len(schedule),
+        status=status,
+        width=solver.upper if solver.upper <= solver.max_width else None,
+        lower_bound=solver.lower + 1,
+        optimal=status == 'optimal',
+        encode_time=round(encoded - start, 3),
+        solve_time=round(solved - encoded, 3),
+        clauses=solver.clauses,
+        variables=solver.var.used,
+    )
+
+
+def run_batch(instances, solver_args=None, time_limit=None, processes=None):
+    """Solve instances in parallel.
+
+    Args:
+        instances: List of the parameters of each instance
+        solver_args: Keyword arguments passed to ``PackingSolver``
+        time_limit: Time limit in seconds for solving a single instance, not
+            including the time to generate the CNF
+        processes: Number of worker processes (defaults to the CPU count)
+
+    Returns:
+        List of the results of each instance, see ``result_fields``
+    """
+    tasks = [
+        (index, params, solver_args or {}, time_limit)
+        for index, params in enumerate(instances)
+    ]
+
+    results = []
+
+    with multiprocessing.Pool(processes) as pool:
+        for result in pool.imap_unordered(_solve, tasks):
+            progress = f'({len(results) + 1}/{len(tasks)} done)'
+            if result['status'] == 'error':
+                print(
+                    f'instance {result["instance"]}: failed with '
+                    f'{result["error"]} {progress}')
+            else:
+                print(
+                    f'instance {result["instance"]}: {result["status"]} '
+                    f'width {result["width"]}, lower bound '
+                    f'{result["lower_bound"]}, solved in '
+                    f'{result["solve_time"]:.2f}s {progress}')
+            results.append(result)
+
+    results.sort(key=lambda result: result['instance'])
+    return results
+
+
+def write_results(path, results):
+    """Write results as JSON if path ends in ``.json``, as CSV otherwise."""
+    with open(path, 'w', newline='') as results_file:
+        if path.endswith('.json'):
+            json.dump(results, results_file, indent=1)
+        else:
+            writer = csv.DictWriter(results_file, result_fields)
+            writer.writeheader()
+            writer.writerows(results)
@@ -22,3 +22,9 @@ ${CXX:-g++} \
     -shared \
     -o ../libcadical.so \
     -Wl,--whole-archive build/libcadical.a -Wl,--no-whole-archive
+
+cd ..
+
+# Compiled bindings, pycadical.py falls back to loading libcadical.so at
+# runtime if these aren't available
+${PYTHON:-python3} pycadical_build.py
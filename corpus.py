@@ -0,0 +1,189 @@
+"""Generation and storage of instance corpora for benchmarking.
+
+Schedules are stored in a compact binary format. Shapes are referred to by
+their index into ``shapes.well_known_shapes`` instead of storing all
+orientations. A schedule file consists of a 12 byte header
+
+    magic b'PSCH', format version (uint32), number of items (uint32)
+
+followed by three arrays with one entry per item: the begin steps (uint32),
+the end steps (uint32) and the shape indices (uint8). All integers are little
+endian.
+
+A corpus is a directory of such files together with an ``index.json`` listing
+the parameters and seed used to generate each schedule, so every instance can
+also be regenerated using ``demo.py``.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import struct
+import sys
+from array import array
+from itertools import product
+
+from gen_instance import random_instance
+from shapes import well_known_shapes
+
+_magic = b'PSCH'
+_version = 1
+_header = struct.Struct('<4sII')
+
+
+def _little_endian(values):
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def save_schedule(path, schedule, shapes=well_known_shapes):
+    """Write a schedule in the binary schedule format.
+
+    All shapes of the schedule need to be contained in shapes.
+    """
+    shape_ids = {id(shape): shape_id for shape_id, shape in enumerate(shapes)}
+
+    begins = array('I')
+    ends = array('I')
+    shape_indices = array('B')
+
+    for begin, end, shape in schedule:
+        try:
+            shape_indices.append(shape_ids[id(shape)])
+        except KeyError:
+            # fall back to comparing by value for shapes that were copied
+            shape_indices.append(shapes.index(shape))
+        begins.append(begin)
+        ends.append(end)
+
+    with open(path, 'wb') as schedule_file:
+        schedule_file.write(_header.pack(_magic, _version, len(begins)))
+        for values in (begins, ends, shape_indices):
+            _little_endian(values).tofile(schedule_file)
+
+
+def load_schedule(path, shapes=well_known_shapes):
+    """Read a schedule written by ``save_schedule``."""
+    with open(path, 'rb') as schedule_file:
+        magic, version, items = _header.unpack(
+            schedule_file.read(_header.size))
+        if magic != _magic or version != _version:
+            raise ValueError(f'{path} is not a schedule file')
+
+        begins = array('I')
+        ends = array('I')
+        shape_indices = array('B')
+
+        for values in (begins, ends, shape_indices):
+            values.fromfile(schedule_file, items)
+            _little_endian(values)
+
+    return list(zip(begins, ends, map(shapes.__getitem__, shape_indices)))
+
+
+def instance_seed(base_seed, steps, fill, duration, index):
+    """Deterministic seed for an instance of the corpus.
+
+    The seed only depends on the parameters of the instance, so adding
+    parameters to the grid doesn't change existing instances.
+    """
+    key = f'{base_seed}/{steps}/{fill}/{duration}/{index}'.encode()
+    return int.from_bytes(hashlib.sha256(key).digest()[:8], 'little')
+
+
+def _generate(task):
+    directory, steps, fill, duration, index, seed = task
+
+    schedule = random_instance(
+        well_known_shapes, steps, fill, duration, seed)
+
+    file_name = f'steps{steps}_fill{fill}_duration{duration}_{index}.sched'
+    save_schedule(os.path.join(directory, file_name), schedule)
+
+    return {
+        'file': file_name,
+        'steps': steps,
+        'fill': fill,
+        'duration': duration,
+        'seed': seed,
+        'items': len(schedule),
+    }
+
+
+def build_corpus(
+        directory, steps, fills, durations, count, base_seed=0,
+        processes=None):
+    """Generate a corpus of schedules for a parameter grid.
+
+    Args:
+        directory: Output directory
+        steps: List of numbers of time steps
+        fills: List of fill limits
+        durations: List of duration limits
+        count: Number of instances for each combination of parameters
+        base_seed: Seed from which all instance seeds are derived
+        processes: Number of worker processes (defaults to the CPU count)
+
+    Returns:
+        The list of index entries, which is also written to ``index.json``.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    tasks = [
+        (directory, step_count, fill, duration, index,
+         instance_seed(base_seed, step_count, fill, duration, index))
+        for step_count, fill, duration in product(steps, fills, durations)
+        for index in range(count)
+    ]
+
+    with multiprocessing.Pool(processes) as pool:
+        entries = pool.map(_generate, tasks, chunksize=1)
+
+    with open(os.path.join(directory, 'index.json'), 'w') as index_file:
+        json.dump(entries, index_file, indent=1)
+
+    return entries
+
+
+def load_index(directory):
+    """Read the index entries of a corpus."""
+    with open(os.path.join(directory, 'index.json')) as index_file:
+        return json.load(index_file)
+
+
+def load_corpus(directory):
+    """Iterate over ``(entry, schedule)`` pairs of a corpus."""
+    for entry in load_index(directory):
+        yield entry, load_schedule(os.path.join(directory, entry['file']))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='generate a corpus of problem instances')
+    parser.add_argument('directory', type=str, help='output directory')
+    parser.add_argument('--steps', type=int, nargs='+', required=True,
+                        help='numbers of time steps')
+    parser.add_argument('--fill', type=int, nargs='+', required=True,
+                        help='limits of blocks present at the same time')
+    parser.add_argument('--duration', type=int, nargs='+', required=True,
+                        help='limits of steps an item is present')
+    parser.add_argument('--count', type=int, default=1,
+                        help='number of instances per parameter combination')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed from which instance seeds are derived')
+    parser.add_argument('--processes', type=int,
+                        help='number of worker processes')
+
+    args = parser.parse_args()
+
+    entries = build_corpus(
+        args.directory, args.steps, args.fill, args.duration, args.count,
+        base_seed=args.seed, processes=args.processes)
+
+    print(f'generated {len(entries)} instances')
+
+
+if __name__ == '__main__':
+    main()
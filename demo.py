@@ -1,4 +1,5 @@
 import argparse
+import sys
 
 from gen_instance import random_instance
 from shapes import well_known_shapes
@@ -19,25 +20,144 @@ parser.add_argument('--max-width', type=int,
                     help='maximal width of the packing area')
 parser.add_argument('--no-cardinality', action='store_true',
                     help='do not use cardinality constraints')
+parser.add_argument('--no-compress-steps', action='store_true',
+                    help='encode every time step separately')
 parser.add_argument('--at-most-one', type=str, default='product',
-                    choices=['product', 'binary', 'commander'],
+                    choices=['product', 'binary', 'commander', 'sequential',
+                             'bimander', 'nested', 'auto'],
                     help='encoding to use for at most one constraints')
+parser.add_argument('--profile', type=str,
+                    help='set the SAT solver options of this profile (see '
+                    'tune_options.py)')
 parser.add_argument('--verbose', action='store_true',
                     help='verbose solver logging')
+parser.add_argument('--lazy-overlap', action='store_true',
+                    help='only add constraints against overlapping items '
+                    'when a solution violates them')
+parser.add_argument('--core-guided', action='store_true',
+                    help='use selector literals for the items and try the '
+                    'items of the last unsatisfiable core first')
+parser.add_argument('--grow', action='store_true',
+                    help='start with a narrow packing area and add columns '
+                    'until a solution is found')
+parser.add_argument('--pareto', action='store_true',
+                    help='find all pareto optimal combinations of height '
+                    '(up to --height) and width')
 parser.add_argument('--ip', action='store_true',
                     help='use the IP formulation and CBC as solver')
+parser.add_argument('--threads', type=int,
+                    help='number of threads used by CBC')
+parser.add_argument('--time-limit', type=float,
+                    help='time limit for CBC or for each instance of a batch '
+                    'in seconds')
+parser.add_argument('--mip-start', type=str,
+                    help='solution file to use as starting point for CBC')
+parser.add_argument('--cbc', type=str, default='cbc',
+                    help='CBC executable')
+parser.add_argument('--dimacs', type=str,
+                    help='also write the CNF to this file (.gz to compress)')
+parser.add_argument('--dimacs-only', action='store_true',
+                    help='only write the CNF instead of solving it')
 parser.add_argument('--seed', type=int, nargs='?',
                     help='random seed for instance generation')
+parser.add_argument('--schedule', type=str,
+                    help='load the schedule from this file (see corpus.py) '
+                    'instead of generating it')
+parser.add_argument('--checkpoint', type=str,
+                    help='periodically save the optimization state to this '
+                    'file and resume from it if it exists')
+parser.add_argument('--seeds', type=int, nargs='+',
+                    help='solve a batch of instances using these seeds')
+parser.add_argument('--batch', type=str,
+                    help='solve a batch of instances using the parameters '
+                    'from this JSON file (see batch.py)')
+parser.add_argument('--processes', type=int,
+                    help='number of worker processes in batch mode')
+parser.add_argument('--results', type=str, default='results.csv',
+                    help='file to write the results of a batch to (.json or '
+                    '.csv)')
 
 args = parser.parse_args()
 
-items = random_instance(
-    well_known_shapes,
-    args.steps,
-    args.fill,
-    args.duration,
-    args.seed
-)
+if args.dimacs_only and args.dimacs is None:
+    parser.error('--dimacs-only requires --dimacs')
+
+if args.grow and (args.pareto or args.dimacs is not None):
+    parser.error('--grow cannot be combined with --pareto or --dimacs')
+
+if args.lazy_overlap and (args.grow or args.dimacs is not None):
+    parser.error('--lazy-overlap cannot be combined with --grow or --dimacs')
+
+if args.core_guided and (args.ip or args.grow or args.dimacs is not None):
+    parser.error('--core-guided cannot be combined with --ip, --grow or '
+                 '--dimacs')
+
+if args.checkpoint is not None and (
+        args.ip or args.pareto or args.dimacs_only):
+    parser.error('--checkpoint cannot be combined with --ip, --pareto or '
+                 '--dimacs-only')
+
+if args.profile is not None and (args.ip or args.dimacs_only):
+    parser.error('--profile cannot be combined with --ip or --dimacs-only')
+
+if args.seeds is not None or args.batch is not None:
+    if args.seeds is not None and args.batch is not None:
+        parser.error('--seeds cannot be combined with --batch')
+    if (args.ip or args.grow or args.pareto or args.dimacs is not None or
+            args.checkpoint is not None):
+        parser.error('batch mode cannot be combined with --ip, --grow, '
+                     '--pareto, --dimacs or --checkpoint')
+
+    from batch import load_batch, run_batch, write_results
+
+    defaults = dict(
+        steps=args.steps,
+        fill=args.fill,
+        duration=args.duration,
+        seed=args.seed,
+        schedule=args.schedule,
+        height=args.height,
+        max_width=args.max_width,
+    )
+
+    if args.batch is not None:
+        instances = load_batch(args.batch, defaults)
+    else:
+        instances = [dict(defaults, seed=seed) for seed in args.seeds]
+
+    solver_options = None
+    if args.profile is not None:
+        from tune_options import load_profile
+        solver_options = load_profile(args.profile)['options']
+
+    results = run_batch(
+        instances,
+        solver_args=dict(
+            use_cardinality=not args.no_cardinality,
+            compress_steps=not args.no_compress_steps,
+            at_most_one=args.at_most_one,
+            lazy_overlap=args.lazy_overlap,
+            solver_options=solver_options,
+            core_guided=args.core_guided,
+        ),
+        time_limit=args.time_limit,
+        processes=args.processes,
+    )
+    write_results(args.results, results)
+    print(f'wrote results of {len(results)} instances to {args.results}')
+    sys.exit()
+
+if args.schedule is not None:
+    from corpus import load_schedule
+    items = load_schedule(args.schedule)
+else:
+    items = random_instance(
+        well_known_shapes,
+        args.steps,
+        args.fill,
+        args.duration,
+        args.seed
+    )
 
 print(f'placing {len(items)} items')
 
@@ -47,15 +167,74 @@ if args.ip:
         items,
         args.height, args.max_width,
         use_cardinality=not args.no_cardinality,
+        compress_steps=not args.no_compress_steps,
+    )
+
+    mip_start = None
+    if args.mip_start is not None:
+        from solution import grid_placements, read_solution
+        mip_start = grid_placements(items, read_solution(args.mip_start))
+
+    solver.optimize(
+        threads=args.threads,
+        time_limit=args.time_limit,
+        mip_start=mip_start,
+        cbc=args.cbc,
     )
 else:
     from packing import PackingSolver
-    solver = PackingSolver(
-        items,
-        args.height, args.max_width,
+    from packing_growing import GrowingPackingSolver
+    from solution import exit_on_interrupt
+
+    # solutions waiting to be written aren't lost on Ctrl-C
+    exit_on_interrupt()
+
+    dimacs = None
+    if args.dimacs is not None:
+        from dimacs import DimacsWriter, save_variable_map
+        dimacs = DimacsWriter(args.dimacs)
+
+    solver_options = None
+    if args.profile is not None:
+        from tune_options import load_profile
+        solver_options = load_profile(args.profile)['options']
+
+    options = dict(
         use_cardinality=not args.no_cardinality,
+        compress_steps=not args.no_compress_steps,
         at_most_one=args.at_most_one,
-        verbose=args.verbose
+        verbose=args.verbose,
+        solver_options=solver_options,
+        solver=dimacs if args.dimacs_only else None,
+        dimacs=None if args.dimacs_only else dimacs,
     )
 
-solver.optimize()
+    if args.grow:
+        solver = GrowingPackingSolver(
+            items, args.height, args.max_width, **options)
+    else:
+        solver = PackingSolver(
+            items, args.height, args.max_width,
+            optimize_height=args.pareto,
+            lazy_overlap=args.lazy_overlap,
+            core_guided=args.core_guided,
+            **options)
+
+    if dimacs is not None:
+        # only the encoding is exported, not the clauses added to bound the
+        # width while optimizing
+        solver.dimacs = None
+        dimacs.close()
+        save_variable_map(f'{args.dimacs}.map.json', solver)
+        print(f'wrote {args.dimacs} and {args.dimacs}.map.json')
+
+    if args.checkpoint is not None:
+        solver.resume(args.checkpoint)
+        solver.checkpoint = args.checkpoint
+
+    if args.dimacs_only:
+        pass
+    elif args.pareto:
+        solver.pareto_front()
+    else:
+        solver.optimize()
@@ -0,0 +1,205 @@
+"""Streaming DIMACS export and import of packing instances.
+
+A ``DimacsWriter`` can be passed to ``PackingSolver`` either in place of the
+SAT solver or in addition to it (using the ``dimacs`` argument). It writes the
+clauses to a (optionally gzip compressed) DIMACS CNF file as they are
+generated, so the instance can be solved by a standalone solver. Together
+with the variable map written by ``save_variable_map`` the model produced by
+such a solver can be turned back into a ``solution_{width}.json`` file.
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import tempfile
+
+from solution import solution_grid, write_solution
+
+
+def _open(path, mode):
+    if str(path).endswith('.gz'):
+        return gzip.open(path, mode + 't')
+    return open(path, mode)
+
+
+class DimacsWriter:
+    # Space reserved for the problem line of uncompressed files. It is
+    # overwritten with the actual counts when the file is closed.
+    header_width = 64
+
+    def __init__(self, path):
+        """Stream clauses into a DIMACS CNF file.
+
+        Files ending in ``.gz`` are gzip compressed. As the header with the
+        variable and clause counts is only known at the end, compressed
+        output is first spooled to an uncompressed temporary file.
+
+        Args:
+            path: Output file name
+        """
+        self.path = path
+        self.variables = 0
+        self.clauses = 0
+        self.compress = str(path).endswith('.gz')
+
+        if self.compress:
+            self.file = tempfile.TemporaryFile(
+                'w+', dir=os.path.dirname(os.path.abspath(path)))
+        else:
+            self.file = open(path, 'w')
+            self.file.write(' ' * (self.header_width - 1) + '\n')
+
+    def add_clause(self, clause):
+        self.clauses += 1
+        for lit in clause:
+            if lit > self.variables:
+                self.variables = lit
+            elif -lit > self.variables:
+                self.variables = -lit
+        self.file.write(' '.join(map(str, clause)) + ' 0\n')
+
+    def close(self):
+        header = f'p cnf {self.variables} {self.clauses}'
+
+        if self.compress:
+            self.file.seek(0)
+            with gzip.open(self.path, 'wt') as output:
+                output.write(header + '\n')
+                shutil.copyfileobj(self.file, output)
+        else:
+            assert len(header) < self.header_width
+            self.file.seek(0)
+            self.file.write(header)
+
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_dimacs(path):
+    """Iterate over the clauses of a (possibly gzip compressed) CNF file.
+
+    Clauses are yielded one at a time as lists of literals, so they can be
+    passed to ``Solver.add_clause`` without reading the whole file.
+    """
+    clause = []
+    with _open(path, 'r') as cnf_file:
+        for line in cnf_file:
+            if line[:1] in ('c', 'p', '%'):
+                continue
+            for lit in map(int, line.split()):
+                if lit == 0:
+                    yield clause
+                    clause = []
+                else:
+                    clause.append(lit)
+    if clause:
+        yield clause
+
+
+def read_model(path):
+    """Read the true variables from a solver's output.
+
+    Understands the usual competition format with ``s`` and ``v`` lines as
+    well as plain lists of literals (as written by e.g. MiniSat).
+
+    Returns:
+        The set of variables that are true, or None if the solver reported
+        the instance as unsatisfiable.
+
+    Raises:
+        ValueError: The solver reported neither a model nor unsatisfiability,
+            e.g. ``s UNKNOWN`` after a timeout
+    """
+    true_vars = set()
+    with _open(path, 'r') as model_file:
+        for line in model_file:
+            fields = line.split()
+            if not fields or fields[0] == 'c':
+                continue
+            if fields[0] == 'v':
+                fields = fields[1:]
+            elif fields[0] == 's' or fields[0].isalpha():
+                # competition format status line or MiniSat's first line
+                status = ' '.join(fields[fields[0] == 's':])
+                if status in ('UNSATISFIABLE', 'UNSAT'):
+                    return None
+                if status not in ('SATISFIABLE', 'SAT'):
+                    raise ValueError(f'{path}: solver reported {status!r}')
+                continue
+            for lit in map(int, fields):
+                if lit > 0:
+                    true_vars.add(lit)
+    return true_vars
+
+
+def save_variable_map(path, packing_solver):
+    """Write the sidecar file describing the variables of a packing instance.
+
+    It contains the schedule and dimensions as well as the meaning of all
+    choice variables and the ``block_vars`` chain used to bound the width.
+    """
+    with open(path, 'w') as map_file:
+        json.dump({
+            'schedule': packing_solver.schedule,
+            'height': packing_solver.height,
+            'max_width': packing_solver.max_width,
+            'choices': [
+                [var, *choice]
+                for var, choice in packing_solver.choices.items()
+            ],
+            'block_vars': packing_solver.block_vars,
+        }, map_file)
+
+
+def load_solution(map_path, true_vars):
+    """Turn a model into a solution grid using a variable map.
+
+    Returns:
+        A ``(width, grid)`` tuple where grid has the format of the
+        ``solution_{width}.json`` files.
+    """
+    with open(map_path) as map_file:
+        variable_map = json.load(map_file)
+
+    width = variable_map['max_width'] - sum(
+        var in true_vars for var in variable_map['block_vars'])
+
+    placements = [
+        choice for var, *choice in variable_map['choices']
+        if var in true_vars
+    ]
+
+    return width, solution_grid(
+        variable_map['schedule'], variable_map['height'], width, placements)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='convert a model of an exported instance into a solution')
+    parser.add_argument('map', type=str, help='variable map file name')
+    parser.add_argument('model', type=str, help='solver output file name')
+
+    args = parser.parse_args()
+
+    try:
+        true_vars = read_model(args.model)
+    except ValueError as error:
+        parser.error(str(error))
+    if true_vars is None:
+        print('instance is unsatisfiable')
+        return
+
+    width, output = load_solution(args.map, true_vars)
+    write_solution(width, output)
+
+    print(f'wrote solution_{width}.json')
+
+
+if __name__ == '__main__':
+    main()
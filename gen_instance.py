@@ -1,8 +1,130 @@
 from random import Random
+import math
 
 
-def random_instance(shapes, steps, max_fill, max_duration, seed=None):
-    """Generate a random schedule of blocks.
+class _FillLevels:
+    """Number of cells used for each time step.
+
+    This is a segment tree supporting adding a value to a range of steps, range
+    maximum queries and searching for the nearest step above a given level.
+    Each node stores the maximum of its subtree including the values added to
+    the whole subtree.
+    """
+
+    def __init__(self, steps):
+        self.size = 1
+        while self.size < steps:
+            self.size *= 2
+
+        # Padding steps count as infinitely full, so searching to the right
+        # stops at the end of the schedule.
+        self.max = [0] * self.size + [0] * steps + [math.inf] * (
+            self.size - steps)
+        self.add = [0] * (2 * self.size)
+
+        for node in range(self.size - 1, 0, -1):
+            self.max[node] = max(self.max[2 * node], self.max[2 * node + 1])
+
+    def range_add(self, begin, end, value, node=1, lo=0, hi=None):
+        """Add value to the fill level of all steps in [begin, end)."""
+        if hi is None:
+            hi = self.size
+        if begin <= lo and hi <= end:
+            self.max[node] += value
+            self.add[node] += value
+            return
+        mid = (lo + hi) // 2
+        if begin < mid:
+            self.range_add(begin, end, value, 2 * node, lo, mid)
+        if mid < end:
+            self.range_add(begin, end, value, 2 * node + 1, mid, hi)
+        self.max[node] = max(
+            self.max[2 * node], self.max[2 * node + 1]) + self.add[node]
+
+    def range_max(self, begin, end, node=1, lo=0, hi=None):
+        """Maximum fill level of all steps in [begin, end)."""
+        if hi is None:
+            hi = self.size
+        if begin <= lo and hi <= end:
+            return self.max[node]
+        mid = (lo + hi) // 2
+        result = -math.inf
+        if begin < mid:
+            result = self.range_max(begin, end, 2 * node, lo, mid)
+        if mid < end:
+            result = max(
+                result, self.range_max(begin, end, 2 * node + 1, mid, hi))
+        return result + self.add[node]
+
+    def first_above(self, begin, level, node=1, lo=0, hi=None):
+        """First step at or after begin with a fill level above level."""
+        if hi is None:
+            hi = self.size
+        if hi <= begin or self.max[node] <= level:
+            return None
+        if hi - lo == 1:
+            return lo
+        level -= self.add[node]
+        mid = (lo + hi) // 2
+        found = self.first_above(begin, level, 2 * node, lo, mid)
+        if found is None:
+            found = self.first_above(begin, level, 2 * node + 1, mid, hi)
+        return found
+
+    def last_above(self, end, level, node=1, lo=0, hi=None):
+        """Last step before end with a fill level above level."""
+        if hi is None:
+            hi = self.size
+        if end <= lo or self.max[node] <= level:
+            return None
+        if hi - lo == 1:
+            return lo
+        level -= self.add[node]
+        mid = (lo + hi) // 2
+        found = self.last_above(end, level, 2 * node + 1, mid, hi)
+        if found is None:
+            found = self.last_above(end, level, 2 * node, lo, mid)
+        return found
+
+
+class _OpenSteps:
+    """The sorted set of time steps that aren't full yet.
+
+    A Fenwick tree counting the open steps, which allows selecting the k-th
+    open step in logarithmic time.
+    """
+
+    def __init__(self, steps):
+        self.count = steps
+        self.tree = [i & -i for i in range(steps + 1)]
+        self.top = 1 << steps.bit_length()
+
+    def close(self, step):
+        self.count -= 1
+        i = step + 1
+        while i < len(self.tree):
+            self.tree[i] -= 1
+            i += i & -i
+
+    def select(self, k):
+        """The k-th (starting at 0) open step."""
+        pos = 0
+        bit = self.top
+        while bit:
+            if pos + bit < len(self.tree) and self.tree[pos + bit] <= k:
+                pos += bit
+                k -= self.tree[pos]
+            bit >>= 1
+        return pos
+
+
+def iter_random_instance(shapes, steps, max_fill, max_duration, seed=None):
+    """Generate a random schedule of blocks one block at a time.
+
+    This produces the same blocks as ``random_instance`` but yields them in
+    the order they are generated instead of returning a sorted list. The fill
+    levels are kept in a segment tree, so generating a block only takes
+    logarithmic time in the number of steps.
 
     Args:
         shapes: The list of shapes to pick from (see shapes.py)
@@ -11,16 +133,14 @@ def random_instance(shapes, steps, max_fill, max_duration, seed=None):
         max_duration: Max number of steps a block is scheduled
         seed: Random seed (optional)
 
-    Returns:
-        A list of (begin, end, shape) tuples where shape is scheduled for the
-        time interval [begin, end)
+    Yields:
+        (begin, end, shape) tuples where shape is scheduled for the time
+        interval [begin, end)
     """
     random = Random(seed)
 
-    schedule = []
-
     # We keep track of the number of cells used for each time step
-    fill_levels = {i: 0 for i in range(steps)}
+    fill_levels = _FillLevels(steps)
 
     # To know whether we can place a nother block we compute the smallest
     # number of cells used by any block
@@ -29,30 +149,25 @@ def random_instance(shapes, steps, max_fill, max_duration, seed=None):
     # We can place another block at or below this fill level
     fill_limit = max_fill - min_shape
 
-    while True:
-        # Select a single time step that isn't full yet
-        try:
-            selected = random.choice([
-                i for i in range(steps) if fill_levels[i] <= fill_limit
-            ])
-        except IndexError:
-            break
-
-        # Extend the interval as far back as possible
-        begin = selected
-        try:
-            while fill_levels[begin - 1] <= fill_limit:
-                begin -= 1
-        except KeyError:
-            pass
-
-        # And es far forward as possible
-        end = selected + 1
-        try:
-            while fill_levels[end] <= fill_limit:
-                end += 1
-        except KeyError:
-            pass
+    # When not even the smallest block fits, every step is full from the start
+    if fill_limit < 0:
+        return
+
+    # As fill levels only increase, a step that is full stays full
+    open_steps = _OpenSteps(steps)
+
+    while open_steps.count:
+        # Select a single time step that isn't full yet. Choosing from a range
+        # consumes the same random numbers as choosing from the list of open
+        # steps.
+        selected = open_steps.select(random.choice(range(open_steps.count)))
+
+        # Extend the interval as far back and as far forward as possible
+        begin = fill_levels.last_above(selected, fill_limit)
+        begin = 0 if begin is None else begin + 1
+
+        end = fill_levels.first_above(selected + 1, fill_limit)
+        end = steps if end is None else min(end, steps)
 
         # Select a random duration that is a) smaller than the interval we just
         # found and b) smaller than the max duration we want to schedule a
@@ -66,9 +181,7 @@ def random_instance(shapes, steps, max_fill, max_duration, seed=None):
         # We need the maximum fill level of any step in that interval to know
         # which blocks do fit (in case the blocks have different numbers of
         # cells)
-        fill_level = max(
-            fill_levels[i] for i in range(block_begin, block_end)
-        )
+        fill_level = fill_levels.range_max(block_begin, block_end)
 
         # Now we select a shape that fits in the margin between the current and
         # the maximum fill level
@@ -81,11 +194,36 @@ def random_instance(shapes, steps, max_fill, max_duration, seed=None):
         # And then update our fill levels
         weight = len(block_shape[0])
 
-        for i in range(block_begin, block_end):
-            fill_levels[i] += weight
+        fill_levels.range_add(block_begin, block_end, weight)
+
+        # All steps of the interval were open before, so every step of it
+        # that is above the limit now just became full
+        step = block_begin
+        while True:
+            step = fill_levels.first_above(step, fill_limit)
+            if step is None or step >= block_end:
+                break
+            open_steps.close(step)
+            step += 1
 
-        schedule.append((block_begin, block_end, block_shape))
+        yield (block_begin, block_end, block_shape)
 
+
+def random_instance(shapes, steps, max_fill, max_duration, seed=None):
+    """Generate a random schedule of blocks.
+
+    Args:
+        shapes: The list of shapes to pick from (see shapes.py)
+        steps: How many time steps the schedule should have in total
+        max_fill: Max number of cells that should be required at the same time
+        max_duration: Max number of steps a block is scheduled
+        seed: Random seed (optional)
+
+    Returns:
+        A list of (begin, end, shape) tuples where shape is scheduled for the
+        time interval [begin, end)
+    """
     # Sorting is only done to make manual inspection of the schedule easier to
     # aid debugging
-    return sorted(schedule)
+    return sorted(iter_random_instance(
+        shapes, steps, max_fill, max_duration, seed))
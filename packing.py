@@ -1,54 +1,86 @@
 """Implementation of the block packing example from the talk.
 """
 from pycadical import Solver
-from itertools import count, islice, combinations
+from itertools import islice, combinations
 from sorting_network import sorting_network
-import time
+from solution import (
+    solution_grid, placements_width, write_solution, SolutionWriter)
+from schedule import compress_schedule
+import hashlib
 import json
+import os
+import time
 import math
 
 
+class DeadlineExceeded(Exception):
+    """Raised by ``PackingSolver.solve`` once the deadline has passed."""
+
+
+class Variables:
+    """Iterator over new variables, counting the variables used so far.
+
+    Unlike ``itertools.count``, the count can be read without using up a
+    variable.
+    """
+
+    def __init__(self):
+        self.used = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self.used += 1
+        return self.used
+
+
 class PackingSolver:
     def __init__(
             self, schedule, height, max_width,
             use_cardinality=True, verbose=False,
             at_most_one='product',
-            solver=None):
+            solver=None, dimacs=None, optimize_height=False,
+            lazy_overlap=False, compress_steps=True, solver_options=None,
+            core_guided=False):
         """Generate an instance of the block packing example.
 
         Args:
             schedule: The given time schedule of blocks (see gen_instance.py)
-            height: The fixed height of the packing area
+            height: The fixed height of the packing area, or the upper bound
+                on the height when optimize_height is set
             max_width: Upper bound on the width of the packing area
             use_cardinality: Whether to generate cardinality constraints
             verbose: Show verbose SAT solver output
             at_most_one: Encoding to use for at_most_one constraints
             solver: Use an existing SAT solver instance
+            dimacs: Also write all clauses to this DimacsWriter
+            optimize_height: Add variables to bound the height too, see
+                ``pareto_front``
+            lazy_overlap: Only add the constraints preventing overlapping
+                items when a found solution violates them. This also disables
+                the cardinality constraints.
+            compress_steps: Encode runs of steps with the same items present
+                only once, see ``schedule.compress_schedule``
+            solver_options: Dictionary of CaDiCaL options to set when creating
+                the SAT solver, e.g. a profile found using ``tune_options.py``
+            core_guided: Only require placing an item while its selector
+                literal is assumed and use the cores of failed selectors to
+                speed up proving bounds, see ``solve_items``. The generated
+                CNF alone doesn't require placing any items.
         """
-        if solver is None:
-            solver = Solver()
-            if not verbose:
-                solver.set_option("quiet", 1)
-
-        self.schedule = schedule
-        self.solver = solver
-        self.var = count(1)
-        self.height = height
-        self.max_width = max_width
-        self.blocked_width = self.max_width
-        self.clauses = 0
-        self.at_most_one_type = at_most_one
+        self.init_state(
+            schedule, height, max_width, verbose=verbose,
+            at_most_one=at_most_one, solver=solver, dimacs=dimacs,
+            compress_steps=compress_steps, solver_options=solver_options)
 
-        self.upper = max_width + 1
-        self.lower = -1
+        schedule = self.model_schedule
 
-        self.lower_timeout = 5
-        self.upper_timeout = 5
+        self.lazy_overlap = lazy_overlap
 
-        # map indicator variables to choices
-        self.choices = {}
-
-        self.steps = max(end for begin, end, shape in schedule)
+        # for each item the literal that requires placing it, when core_guided
+        if core_guided:
+            self.item_selectors = []
 
         # for each time step and position a list of choices that make use of
         # that position in that step
@@ -90,33 +122,73 @@ class PackingSolver:
                                 ).append(choice)
 
             # we need to select exactly one choice for this item
-            self.add_clause(item_choices)
+            if core_guided:
+                selector = next(self.var)
+                self.item_selectors.append(selector)
+                self.add_clause([-selector, *item_choices])
+            else:
+                self.add_clause(item_choices)
             self.at_most_one(item_choices)
 
-        if use_cardinality:
+        if use_cardinality and not lazy_overlap:
+            # consecutive steps with the same items present have the same
+            # choices for a position, these share the variable for their or
+            in_use_vars = {}
+
+            # the count of used positions only holds when all items present
+            # are required, so with selectors it is relaxed by a literal that
+            # is true exactly when one of them isn't selected
+            step_relax = [None] * self.steps
+            if core_guided:
+                step_items = [[] for t in range(self.steps)]
+                for item_id, (begin, end, shape) in enumerate(schedule):
+                    for t in range(begin, end):
+                        step_items[t].append(self.item_selectors[item_id])
+                for t, selectors in enumerate(step_items):
+                    relax = step_relax[t] = next(self.var)
+                    for selector in selectors:
+                        self.add_clause([selector, relax])
+                    self.add_clause([-relax, *(-s for s in selectors)])
+
             for t, use_count in enumerate(pos_used):
                 # for each time step and each position we create the logical or
                 # of all choices that use it
                 in_use = []
                 for j in range(0, max_width):
                     for i in range(0, height):
-                        in_use_var = next(self.var)
-                        in_use.append(in_use_var)
                         blocking_choices = blocked[(t, i, j)]
-                        for choice in blocking_choices:
-                            self.add_clause([-choice, in_use_var])
-                        self.add_clause([-in_use_var, *blocking_choices])
+                        key = tuple(blocking_choices)
+                        in_use_var = in_use_vars.get(key)
+                        if in_use_var is None:
+                            in_use_var = in_use_vars[key] = next(self.var)
+                            for choice in blocking_choices:
+                                self.add_clause([-choice, in_use_var])
+                            self.add_clause([-in_use_var, *blocking_choices])
+                        in_use.append(in_use_var)
+
+                self.cardinality_constraint(
+                    in_use, use_count, use_count, relax=step_relax[t])
 
-                self.cardinality_constraint(in_use, use_count, use_count)
+        # the largest number of cells used in any step gives a lower bound on
+        # the area
+        self.max_cells = max(pos_used)
 
         # to optimize the width used, we add variables that block positions on
         # the right
         self.block_vars = list(islice(self.var, max_width))
 
-        for j, block_var in enumerate(self.block_vars):
-            for i in range(0, height):
-                for t in range(self.steps):
-                    blocked.setdefault((t, i, j), []).append(block_var)
+        if lazy_overlap:
+            # without the per position constraints, we directly exclude each
+            # choice when its rightmost column is blocked
+            for choice, (item_id, i, j, mask_id) in self.choices.items():
+                mask = schedule[item_id][2][mask_id]
+                right = j + max(dj for di, dj in mask)
+                self.add_clause([-choice, -self.block_vars[right]])
+        else:
+            for j, block_var in enumerate(self.block_vars):
+                for i in range(0, height):
+                    for t in range(self.steps):
+                        blocked.setdefault((t, i, j), []).append(block_var)
 
         # we also add impliciations from block_var[i] to block_var[i + 1], so
         # everything to the right of i is also automatically blocked
@@ -125,81 +197,249 @@ class PackingSolver:
                 [-self.block_vars[i], self.block_vars[i + 1]]
             )
 
+        # to also optimize the height, we do the same for rows at the bottom
+        if optimize_height:
+            self.row_block_vars = list(islice(self.var, height))
+
+            # Adding these to the blocked lists would make positions blocked by
+            # both a row and a column conflict. Instead each choice is directly
+            # excluded when its bottom row is blocked.
+            for choice, (item_id, i, j, mask_id) in self.choices.items():
+                mask = schedule[item_id][2][mask_id]
+                bottom = i + max(di for di, dj in mask)
+                self.add_clause([-choice, -self.row_block_vars[bottom]])
+
+            for i in range(len(self.row_block_vars) - 1):
+                self.add_clause(
+                    [-self.row_block_vars[i], self.row_block_vars[i + 1]]
+                )
+
         # now we make sure that only one item uses a position and time step
-        for blocked_list in blocked.values():
-            self.at_most_one(blocked_list)
+        if lazy_overlap:
+            # we keep the choices of each position around to add these
+            # constraints when needed
+            self.blocked = blocked
+        else:
+            for blocked_list in blocked.values():
+                self.at_most_one_once(blocked_list)
 
         print(
-            f'used {self.clauses} clauses and {next(self.var) - 1} variables')
+            f'used {self.clauses} clauses and {self.var.used} variables')
+
+    def init_state(
+            self, schedule, height, max_width, verbose=False,
+            at_most_one='product', solver=None, dimacs=None,
+            compress_steps=True, solver_options=None):
+        """Set up the solver and the optimization state before encoding.
+
+        This is shared with ``GrowingPackingSolver``, so the bounds, the
+        deadline and checkpointing work the same for both.
+        """
+        if solver is None:
+            solver = Solver()
+            if not verbose:
+                solver.set_option("quiet", 1)
+            for name, value in (solver_options or {}).items():
+                solver.set_option(name, value)
+
+        self.schedule = schedule
+
+        # the encoding uses the compressed schedule, the original one is used
+        # for the solution output
+        if compress_steps:
+            schedule = compress_schedule(schedule)
+        self.model_schedule = schedule
+
+        self.solver = solver
+        self.dimacs = dimacs
+        self.var = Variables()
+        self.height = height
+        self.max_width = max_width
+        self.blocked_width = self.max_width
+        self.clauses = 0
+        self.at_most_one_type = at_most_one
+        self.lazy_overlap = False
+
+        # sets of variables for which at_most_one_once was used
+        self.at_most_one_done = set()
+
+        self.upper = max_width + 1
+        self.lower = -1
+
+        self.lower_timeout = 5
+        self.upper_timeout = 5
+
+        # monotonic time after which solve raises DeadlineExceeded, solver
+        # calls are cut short to not run past it
+        self.deadline = None
+
+        # the last solution found by solve, until taken by iter_solutions
+        self.solution = None
+
+        # the best solution found so far
+        self.best_solution = None
+
+        # file to write checkpoints to while optimizing
+        self.checkpoint = None
+
+        # map indicator variables to choices
+        self.choices = {}
+
+        # for each item the literal that requires placing it, when core_guided
+        self.item_selectors = None
+
+        # the items of the last core of failed selectors
+        self.core = None
+
+        # variables blocking rows at the bottom, when optimize_height
+        self.row_block_vars = []
+
+        self.steps = max(end for begin, end, shape in schedule)
 
     def add_clause(self, clause):
         self.clauses += 1
         self.solver.add_clause(clause)
+        if self.dimacs is not None:
+            self.dimacs.add_clause(clause)
 
     def at_most_one(self, variables):
         """Compact and efficient encoding of at most one constraints.
-        """
 
-        if self.at_most_one_type == 'binary':
-            limit = 4
-        elif self.at_most_one_type == 'commander':
-            limit = 16
-        elif self.at_most_one_type == 'product':
-            limit = 16
+        Uses the encoding selected by ``at_most_one`` when creating the
+        instance, falling back to the pairwise encoding for small constraints.
+        With 'auto' the cheapest encoding is selected for each constraint
+        separately, see ``best_at_most_one``.
+        """
+        if self.at_most_one_type == 'auto':
+            encoding = best_at_most_one(len(variables))
         else:
-            raise ValueError(
-                f'unknown at_most_one encoding {self.at_most_one_type}')
-
-        if len(variables) > limit:
-            if self.at_most_one_type == 'binary':
-                bits = (len(variables) - 1).bit_length()
-                index = list(islice(self.var, bits))
-                for i, variable in enumerate(variables):
-                    for bit, index_bit in enumerate(index):
-                        if (i >> bit) & 1:
-                            self.add_clause([-variable, index_bit])
-                        else:
-                            self.add_clause([-variable, -index_bit])
-            elif self.at_most_one_type == 'commander':
-                group_count = int(math.sqrt(len(variables)))
-
-                commanders = list(islice(self.var, group_count))
-
-                groups = [
-                    variables[i::group_count] + [-c]
-                    for i, c in enumerate(commanders)
-                ]
-
-                for group in groups:
-                    self.add_clause(group)
-                    self.at_most_one(group)
-
-                self.at_most_one(commanders)
-            elif self.at_most_one_type == 'product':
-                rows = int(math.sqrt(len(variables)))
-                columns = (len(variables) + rows - 1) // rows
-
-                row_vars = list(islice(self.var, rows))
-                column_vars = list(islice(self.var, columns))
-
-                for i, row_var in enumerate(row_vars):
-                    for j, column_var in enumerate(column_vars):
-                        k = i * columns + j
-                        if k < len(variables):
-                            input_var = variables[k]
-                            self.add_clause([-input_var, row_var])
-                            self.add_clause([-input_var, column_var])
-
-                self.at_most_one(row_vars)
-                self.at_most_one(column_vars)
+            try:
+                limit = at_most_one_limits[self.at_most_one_type]
+            except KeyError:
+                raise ValueError(
+                    f'unknown at_most_one encoding {self.at_most_one_type}'
+                ) from None
+            if len(variables) > limit:
+                encoding = self.at_most_one_type
             else:
-                assert False  # unreachable
-        else:
-            for v1, v2 in combinations(variables, 2):
-                self.add_clause([-v1, -v2])
+                encoding = 'pairwise'
+
+        at_most_one_encodings[encoding](self, variables)
 
-    def cardinality_constraint(self, variables, low, high):
+    def at_most_one_once(self, variables):
+        """Encode an at most one constraint unless it was encoded before.
+
+        An item present for several steps adds its choices to the positions
+        of each step, so the same constraint often occurs repeatedly.
+        """
+        key = tuple(sorted(variables))
+        if key not in self.at_most_one_done:
+            self.at_most_one_done.add(key)
+            self.at_most_one(variables)
+
+    def at_most_one_pairwise(self, variables):
+        for v1, v2 in combinations(variables, 2):
+            self.add_clause([-v1, -v2])
+
+    def at_most_one_binary(self, variables):
+        bits = (len(variables) - 1).bit_length()
+        index = list(islice(self.var, bits))
+        for i, variable in enumerate(variables):
+            for bit, index_bit in enumerate(index):
+                if (i >> bit) & 1:
+                    self.add_clause([-variable, index_bit])
+                else:
+                    self.add_clause([-variable, -index_bit])
+
+    def at_most_one_commander(self, variables):
+        group_count = int(math.sqrt(len(variables)))
+
+        commanders = list(islice(self.var, group_count))
+
+        groups = [
+            variables[i::group_count] + [-c]
+            for i, c in enumerate(commanders)
+        ]
+
+        for group in groups:
+            self.add_clause(group)
+            self.at_most_one(group)
+
+        self.at_most_one(commanders)
+
+    def at_most_one_product(self, variables):
+        rows = int(math.sqrt(len(variables)))
+        columns = (len(variables) + rows - 1) // rows
+
+        row_vars = list(islice(self.var, rows))
+        column_vars = list(islice(self.var, columns))
+
+        for i, row_var in enumerate(row_vars):
+            for j, column_var in enumerate(column_vars):
+                k = i * columns + j
+                if k < len(variables):
+                    input_var = variables[k]
+                    self.add_clause([-input_var, row_var])
+                    self.add_clause([-input_var, column_var])
+
+        self.at_most_one(row_vars)
+        self.at_most_one(column_vars)
+
+    def at_most_one_sequential(self, variables):
+        # Each ladder variable is implied by all variables up to its position
+        # and excludes the next variable.
+        ladder = list(islice(self.var, len(variables) - 1))
+
+        for i, variable in enumerate(variables):
+            if i > 0:
+                self.add_clause([-variable, -ladder[i - 1]])
+            if i < len(ladder):
+                self.add_clause([-variable, ladder[i]])
+                if i > 0:
+                    self.add_clause([-ladder[i - 1], ladder[i]])
+
+    def at_most_one_bimander(self, variables):
+        # Pairs of variables share an index that is binary encoded, within
+        # each pair the pairwise encoding is used.
+        groups = [variables[i:i + 2] for i in range(0, len(variables), 2)]
+
+        bits = (len(groups) - 1).bit_length()
+        index = list(islice(self.var, bits))
+
+        for i, group in enumerate(groups):
+            self.at_most_one_pairwise(group)
+            for variable in group:
+                for bit, index_bit in enumerate(index):
+                    if (i >> bit) & 1:
+                        self.add_clause([-variable, index_bit])
+                    else:
+                        self.add_clause([-variable, -index_bit])
+
+    def at_most_one_nested(self, variables):
+        # The variables are split into pairs. For every pair but the last, a
+        # new variable is implied by all later pairs and the pair together
+        # with that variable uses the pairwise encoding.
+        groups = [variables[i:i + 2] for i in range(0, len(variables), 2)]
+
+        later = list(islice(self.var, len(groups) - 1))
+
+        for i, group in enumerate(groups):
+            if i < len(later):
+                self.at_most_one_pairwise(group + [later[i]])
+                for variable in groups[i + 1]:
+                    self.add_clause([-variable, later[i]])
+                if i + 1 < len(later):
+                    self.add_clause([-later[i + 1], later[i]])
+            else:
+                self.at_most_one_pairwise(group)
+
+    def cardinality_constraint(self, variables, low, high, relax=None):
+        """Constrain the number of true variables to be in [low, high].
+
+        When relax is given, the bounds only hold while relax is false.
+        """
         variables = list(variables)
+        relax = [] if relax is None else [relax]
 
         for a, b in sorting_network(len(variables)):
             out_low, out_high = next(self.var), next(self.var)
@@ -218,15 +458,27 @@ class PackingSolver:
 
         for i, var in enumerate(variables[::-1]):
             if i < low:
-                self.add_clause([var])
+                self.add_clause([var, *relax])
             elif i >= high:
-                self.add_clause([-var])
+                self.add_clause([-var, *relax])
 
     def optimize(self):
         """Find an optimal solution.
 
         Solutions are written to ``solution_$width.json`` files in the current
-        directory. Those can be viewed using ``view_sol.py``.
+        directory. Those can be viewed using ``view_sol.py``. The files are
+        written by a background thread, so the solver doesn't wait for them.
+        """
+        with SolutionWriter(self.schedule, self.height) as writer:
+            for width, placements in self.iter_solutions():
+                writer.put(width, placements)
+
+    def iter_solutions(self):
+        """Find an optimal solution, yielding each improving solution.
+
+        Yields:
+            ``(width, placements)`` tuples, see ``solution.py`` for the format
+            of placements
         """
 
         # To find an optimal solution we further constrain the width whenever a
@@ -245,30 +497,55 @@ class PackingSolver:
         # fare better for larger problems.
 
         print("optimizing...")
+
+        # a solution restored from a checkpoint
+        yield from self.take_solution()
+
         while self.lower + 1 < self.upper:
 
             # Only one case left?
             if self.lower + 2 == self.upper:
                 self.solve(self.lower + 1, timeout=None)
+                yield from self.take_solution()
                 break
 
             progress = self.solve(
                 self.upper - 1, timeout=self.upper_timeout)
+            yield from self.take_solution()
             if not progress:
                 self.upper_timeout *= 2
+            self.write_checkpoint()
 
             if self.lower + 1 >= self.upper:
                 break
 
             progress = self.solve(
                 self.lower + 1, timeout=self.lower_timeout)
+            yield from self.take_solution()
             if not progress:
                 self.lower_timeout *= 1.1
+            self.write_checkpoint()
+
+        self.write_checkpoint()
+
+    def take_solution(self):
+        """Yield the solution found by the last call to solve, if any."""
+        if self.solution is not None:
+            solution, self.solution = self.solution, None
+            yield solution
 
     def solve(self, width, timeout=None):
+        if self.deadline is not None:
+            remaining = (
+                self.deadline - time.clock_gettime(time.CLOCK_MONOTONIC))
+            if remaining <= 0:
+                raise DeadlineExceeded()
+            if timeout is None or timeout > remaining:
+                timeout = remaining
+
+        assumptions = []
         if width < self.blocked_width:
-            blocked = self.block_vars[width]
-            self.solver.assume(blocked)
+            assumptions.append(self.block_vars[width])
 
         if timeout is None:
             self.solver.set_terminate(None)
@@ -277,7 +554,7 @@ class PackingSolver:
             self.solver.set_terminate(
                 lambda: time.clock_gettime(time.CLOCK_MONOTONIC) >= end_time)
 
-        result = self.solver.solve()
+        result = self.solve_items(assumptions)
 
         new_lower = False
 
@@ -297,37 +574,370 @@ class PackingSolver:
             print(f"new lower bound {self.lower + 1}..{self.upper}")
 
         if result is True:
-            width = self.max_width - sum(map(self.solver.val, self.block_vars))
-            self.upper = width
-            self.save_solution(width)
-            self.lower_blocked_width(width - 1)
+            self.found_solution()
             print(f"new upper bound {self.lower + 1}..{self.upper}")
             return True
 
         return result is not None
 
+    def found_solution(self):
+        """Use the current model as new upper bound."""
+        width = self.max_width - sum(self.solver.values(self.block_vars))
+        self.upper = width
+        self.solution = self.best_solution = (width, self.placements())
+        self.lower_blocked_width(width - 1)
+
+    def instance_hash(self):
+        """Hash identifying the schedule and height of this instance."""
+        instance = json.dumps([self.schedule, self.height])
+        return hashlib.sha256(instance.encode()).hexdigest()
+
+    def write_checkpoint(self):
+        """Save the state of the optimization to ``self.checkpoint``.
+
+        Does nothing when no checkpoint file is set. See ``resume``.
+        """
+        if self.checkpoint is None:
+            return
+
+        width, placements = self.best_solution or (None, [])
+        state = {
+            'instance': self.instance_hash(),
+            'lower': self.lower,
+            'lower_timeout': self.lower_timeout,
+            'upper_timeout': self.upper_timeout,
+            'width': width,
+            'placements': placements,
+        }
+
+        # replacing the file avoids leaving a partially written checkpoint
+        # when killed
+        with open(f'{self.checkpoint}.tmp', 'w') as checkpoint_file:
+            json.dump(state, checkpoint_file)
+        os.replace(f'{self.checkpoint}.tmp', self.checkpoint)
+
+    def resume(self, path):
+        """Continue an optimization from a checkpoint.
+
+        The proven lower bound is added as unit clause. The best solution of
+        the checkpoint becomes the upper bound and is yielded first by
+        ``iter_solutions``.
+
+        Args:
+            path: Checkpoint written by ``write_checkpoint``
+
+        Returns:
+            Whether the checkpoint exists
+        """
+        try:
+            with open(path) as checkpoint_file:
+                state = json.load(checkpoint_file)
+        except FileNotFoundError:
+            return False
+
+        if state['instance'] != self.instance_hash():
+            raise ValueError(f'{path} is a checkpoint of a different instance')
+
+        self.lower_timeout = state['lower_timeout']
+        self.upper_timeout = state['upper_timeout']
+
+        self.lower = max(self.lower, min(state['lower'], self.max_width))
+        if 0 <= self.lower < self.max_width:
+            self.add_clause([-self.block_vars[self.lower]])
+
+        placements = [tuple(choice) for choice in state['placements']]
+        if placements:
+            width = placements_width(self.schedule, placements)
+        if placements and self.lower < width <= self.max_width:
+            choice_vars = {
+                choice: var for var, choice in self.choices.items()}
+
+            # Solving with the choices of the solution as assumptions finds
+            # the solution again within propagation. Afterwards the solver's
+            # saved phases point towards it for the following searches.
+            assumptions = [choice_vars[choice] for choice in placements]
+            if width < self.max_width:
+                assumptions.append(self.block_vars[width])
+
+            self.solver.set_terminate(None)
+            if self.solve_assuming(assumptions) is True:
+                self.found_solution()
+            else:
+                print(f"ignoring invalid solution of width {width}")
+
+        print(f"resumed at {self.lower + 1}..{self.upper}")
+        return True
+
+    def solve_items(self, assumptions):
+        """Solve under assumptions, requiring all items to be placed.
+
+        With ``core_guided`` the items of the last core are tried on their
+        own first. When these can't be packed, neither can all items, which
+        is often much faster to prove. Otherwise all items are required.
+        After each unsatisfiable result the core is updated to the items whose
+        selectors failed, so it shrinks as long as repeated queries find
+        smaller cores.
+        """
+        if self.item_selectors is None:
+            return self.solve_assuming(assumptions)
+
+        if self.core is not None and len(self.core) < len(self.model_schedule):
+            result = self.solve_assuming(
+                assumptions + [self.item_selectors[i] for i in self.core])
+            if result is not True:
+                if result is False:
+                    self.update_core()
+                return result
+
+        result = self.solve_assuming(assumptions + self.item_selectors)
+        if result is False:
+            self.update_core()
+        return result
+
+    def update_core(self):
+        """Store the items whose selectors caused the last conflict."""
+        self.core = [
+            item_id for item_id, selector in enumerate(self.item_selectors)
+            if self.solver.failed(selector)
+        ]
+        print(f"core of {len(self.core)} items")
+
+    def solve_assuming(self, assumptions):
+        """Solve under assumptions, refining lazy constraints as needed."""
+        while True:
+            for assumption in assumptions:
+                self.solver.assume(assumption)
+
+            result = self.solver.solve()
+
+            if result is not True or not self.lazy_overlap:
+                return result
+
+            if not self.add_overlap_constraints():
+                return result
+
+    def add_overlap_constraints(self):
+        """Add the constraints for positions used twice in the model.
+
+        Returns:
+            Whether any constraints were added
+        """
+        used = set()
+        overlapping = set()
+
+        for item_id, i, j, mask_id in self.placements():
+            begin, end, shape = self.model_schedule[item_id]
+            for di, dj in shape[mask_id]:
+                for t in range(begin, end):
+                    position = (t, i + di, j + dj)
+                    if position in used:
+                        overlapping.add(position)
+                    else:
+                        used.add(position)
+
+        for position in overlapping:
+            self.at_most_one_once(self.blocked.pop(position))
+
+        if overlapping:
+            print(f"added {len(overlapping)} overlap constraints")
+
+        return bool(overlapping)
+
+    def solve_area(self, height, width):
+        """Check whether a packing of the given height and width exists.
+
+        The bounds are only assumed, so the solver keeps everything it learns
+        for later queries with different bounds.
+        """
+        assumptions = []
+        if height < self.height:
+            assumptions.append(self.row_block_vars[height])
+        if width < self.max_width:
+            assumptions.append(self.block_vars[width])
+
+        self.solver.set_terminate(None)
+
+        return self.solve_items(assumptions)
+
+    def pareto_front(self):
+        """Find the Pareto optimal combinations of height and width.
+
+        Requires ``optimize_height``. Heights are processed in increasing
+        order. As a larger height never needs a larger width, only widths below
+        the best width found so far need to be checked for each height. All
+        queries use the same solver instance. For each point of the front the
+        solution is written to ``solution_${height}x${width}.json`` by a
+        background thread.
+
+        Returns:
+            A list of ``(height, width)`` tuples
+        """
+        assert self.row_block_vars, 'requires optimize_height'
+
+        print("computing pareto front...")
+
+        front = []
+        best_width = self.max_width + 1
+
+        # every point of the front gets its own file, so none are skipped
+        with SolutionWriter(self.schedule, self.height, limit=None) as writer:
+            for height in range(1, self.height + 1):
+                width = best_width - 1
+                placements = None
+
+                while (width * height >= self.max_cells and
+                       self.solve_area(height, width)):
+                    placements = self.placements()
+                    width = placements_width(self.schedule, placements) - 1
+
+                if placements is None:
+                    continue
+
+                best_width = width + 1
+                front.append((height, best_width))
+
+                writer.put(best_width, placements, height=height)
+
+                print(
+                    f"found {height}x{best_width} "
+                    f"(area {height * best_width})")
+
+        if front:
+            height, width = min(front, key=lambda point: point[0] * point[1])
+            print(f"smallest area {height}x{width} ({height * width})")
+
+        return front
+
     def lower_blocked_width(self, width):
         if width < self.blocked_width:
             self.blocked_width = width
             blocked = self.block_vars[width]
             self.add_clause([blocked])
 
-    def save_solution(self, width):
-        output = [
-            [[None] * width for _ in range(self.height)]
-            for _ in range(self.steps)
+    def placements(self):
+        """List the placements of all items in the current model."""
+        values = self.solver.values(self.choices)
+        return [
+            choice for choice, value in zip(self.choices.values(), values)
+            if value is True
         ]
 
-        for var, choice in self.choices.items():
-            if self.solver.val(var) is True:
-                item_id, i, j, mask_id = choice
+    def solution_grid(self, width):
+        """Build the per step grid of item ids for the current model."""
+        return solution_grid(
+            self.schedule, self.height, width, self.placements())
 
-                begin, end, shape = self.schedule[item_id]
-
-                for di, dj in shape[mask_id]:
-                    for t in range(begin, end):
-                        assert output[t][i + di][j + dj] is None
-                        output[t][i + di][j + dj] = item_id
-
-        with open(f'solution_{width}.json', 'w') as solution_file:
-            json.dump(output, solution_file)
+    def save_solution(self, width):
+        write_solution(width, self.solution_grid(width))
+
+
+# Largest at most one constraint that uses the pairwise encoding when a fixed
+# encoding is selected.
+at_most_one_limits = {
+    'binary': 4,
+    'commander': 16,
+    'product': 16,
+    'sequential': 4,
+    'bimander': 4,
+    'nested': 4,
+}
+
+at_most_one_encodings = {
+    'pairwise': PackingSolver.at_most_one_pairwise,
+    'binary': PackingSolver.at_most_one_binary,
+    'commander': PackingSolver.at_most_one_commander,
+    'product': PackingSolver.at_most_one_product,
+    'sequential': PackingSolver.at_most_one_sequential,
+    'bimander': PackingSolver.at_most_one_bimander,
+    'nested': PackingSolver.at_most_one_nested,
+}
+
+
+def at_most_one_cost(size, encoding):
+    """Number of clauses and auxiliary variables of an encoding.
+
+    Nested at most one constraints are assumed to use the best encoding for
+    their size.
+
+    Returns:
+        A ``(clauses, variables)`` tuple or None if the encoding doesn't
+        reduce the constraint to smaller ones for this size
+    """
+    if size < 2:
+        return 0, 0
+
+    if size < 4 and encoding in ('commander', 'product'):
+        return None
+
+    if encoding == 'pairwise':
+        return size * (size - 1) // 2, 0
+    elif encoding == 'binary':
+        bits = (size - 1).bit_length()
+        return size * bits, bits
+    elif encoding == 'commander':
+        group_count = int(math.sqrt(size))
+        clauses, variables = _best_at_most_one(group_count)[1:]
+        variables += group_count
+        for i in range(group_count):
+            group_size = len(range(i, size, group_count)) + 1
+            group_clauses, group_variables = _best_at_most_one(group_size)[1:]
+            clauses += 1 + group_clauses
+            variables += group_variables
+        return clauses, variables
+    elif encoding == 'product':
+        rows = int(math.sqrt(size))
+        columns = (size + rows - 1) // rows
+        row_clauses, row_variables = _best_at_most_one(rows)[1:]
+        column_clauses, column_variables = _best_at_most_one(columns)[1:]
+        return (
+            2 * size + row_clauses + column_clauses,
+            rows + columns + row_variables + column_variables,
+        )
+    elif encoding == 'sequential':
+        return 3 * size - 4, size - 1
+    elif encoding == 'bimander':
+        groups = (size + 1) // 2
+        bits = (groups - 1).bit_length()
+        return size // 2 + size * bits, bits
+    elif encoding == 'nested':
+        groups = (size + 1) // 2
+        # pairwise encoding of all groups together with their variable, the
+        # implications from all but the first group and their variables and
+        # the pairwise encoding of the last group
+        clauses = 3 * (groups - 1) + size - 2 + max(groups - 2, 0)
+        if size % 2 == 0:
+            clauses += 1
+        return clauses, groups - 1
+    else:
+        raise ValueError(f'unknown at_most_one encoding {encoding}')
+
+
+_best_at_most_one_cache = {}
+
+
+def _best_at_most_one(size):
+    try:
+        return _best_at_most_one_cache[size]
+    except KeyError:
+        pass
+
+    best = None
+    for encoding in at_most_one_encodings:
+        cost = at_most_one_cost(size, encoding)
+        if cost is None:
+            continue
+        clauses, variables = cost
+        if best is None or clauses + variables < best[1] + best[2]:
+            best = (encoding, clauses, variables)
+
+    _best_at_most_one_cache[size] = best
+    return best
+
+
+def best_at_most_one(size):
+    """The encoding with the fewest clauses plus auxiliary variables.
+
+    The cost model counts clauses and auxiliary variables equally, and nested
+    constraints also use the best encoding for their size.
+    """
+    return _best_at_most_one(size)[0]
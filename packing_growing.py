@@ -0,0 +1,301 @@
+"""Variant of the packing model that adds columns on demand.
+
+Instead of encoding all ``max_width`` columns up front and then searching for
+the smallest width using ``block_vars``, this starts with a width that is a
+lower bound of the optimum and adds one column at a time whenever the current
+width is proven to be infeasible. The first feasible width is optimal.
+
+All columns are added to the same SAT solver instance. Constraints that only
+hold for a specific width, like an item being placed within the current
+columns, are added together with a stage variable and only enforced by
+assuming the stage variable to be false. When moving on to the next width, the
+stage variable is fixed to true, which permanently disables them.
+"""
+from packing import PackingSolver, DeadlineExceeded
+from solution import placements_width
+import json
+import math
+import time
+
+
+class GrowingPackingSolver(PackingSolver):
+    def __init__(
+            self, schedule, height, max_width,
+            use_cardinality=True, verbose=False,
+            at_most_one='product',
+            solver=None, dimacs=None, start_width=None,
+            compress_steps=True, solver_options=None):
+        """Generate the initial columns of the block packing example.
+
+        Args:
+            schedule: The given time schedule of blocks (see gen_instance.py)
+            height: The fixed height of the packing area
+            max_width: Upper bound on the width of the packing area
+            use_cardinality: Whether to generate cardinality constraints
+            verbose: Show verbose SAT solver output
+            at_most_one: Encoding to use for at_most_one constraints
+            solver: Use an existing SAT solver instance
+            dimacs: Also write all clauses to this DimacsWriter
+            start_width: Width to start with, defaults to a simple lower bound.
+                A given width isn't assumed to be a lower bound, so when it is
+                feasible, narrower widths remain unchecked.
+            compress_steps: Encode runs of steps with the same items present
+                only once, see ``schedule.compress_schedule``
+            solver_options: Dictionary of CaDiCaL options to set when creating
+                the SAT solver, e.g. a profile found using ``tune_options.py``
+        """
+        self.init_state(
+            schedule, height, max_width, verbose=verbose,
+            at_most_one=at_most_one, solver=solver, dimacs=dimacs,
+            compress_steps=compress_steps, solver_options=solver_options)
+
+        schedule = self.model_schedule
+
+        self.use_cardinality = use_cardinality
+
+        # for each time step we count how many positions are used
+        self.pos_used = [0] * self.steps
+
+        for begin, end, shape in schedule:
+            for t in range(begin, end):
+                self.pos_used[t] += len(shape[0])
+
+        # The constraints over sets of choices that grow with the width are
+        # kept open for extension. For each item and each time step and
+        # position we store a literal that implies one of the choices added so
+        # far and a list of literals covering the at most one constraint over
+        # those choices.
+        self.or_literals = {}
+        self.at_most_one_groups = {}
+
+        # for each time step and position the variable that is true when the
+        # position is in use
+        self.in_use = {}
+
+        self.width = 0
+        self.stage = None
+
+        if start_width is None:
+            # every item needs to fit and every step needs enough cells
+            start_width = max(
+                max(
+                    min(max(j for i, j in mask) for mask in shape) + 1
+                    for begin, end, shape in schedule
+                ),
+                math.ceil(max(self.pos_used) / height),
+            )
+            self.lower = min(start_width - 1, max_width)
+
+        self.add_columns(min(start_width, max_width))
+
+    def extend_or(self, key, variables):
+        """Literal implying one of the variables added under key so far."""
+        literal = next(self.var)
+        previous = self.or_literals.get(key)
+        if previous is None:
+            self.add_clause([-literal, *variables])
+        else:
+            self.add_clause([-literal, *variables, previous])
+        self.or_literals[key] = literal
+        return literal
+
+    def extend_at_most_one(self, key, variables):
+        """At most one constraint over all variables added under key so far.
+        """
+        group = self.at_most_one_groups.get(key)
+        if group is None:
+            group = list(variables)
+        elif len(group) == 1:
+            group = group + variables
+        else:
+            # Instead of encoding the existing part again, we add a variable
+            # that is implied by it and include that in a new constraint.
+            representative = next(self.var)
+            for variable in group:
+                self.add_clause([-variable, representative])
+            group = [representative, *variables]
+
+        self.at_most_one(group)
+        self.at_most_one_groups[key] = group
+
+    def add_columns(self, width):
+        """Add columns to the right up to width and start a new stage."""
+        old_width = self.width
+        self.width = width
+
+        if self.stage is not None:
+            self.add_clause([self.stage])
+        self.stage = stage = next(self.var)
+
+        # new choices for each position and time step they use
+        new_blocked = {}
+
+        for item_id, (begin, end, shape) in enumerate(self.model_schedule):
+            # the new choices are those that end in one of the new columns
+            item_choices = []
+
+            for mask_id, mask in enumerate(shape):
+                mask_width = max(j for i, j in mask)
+                mask_height = max(i for i, j in mask)
+
+                for i in range(0, self.height - mask_height):
+                    for j in range(
+                            max(0, old_width - mask_width),
+                            width - mask_width):
+                        choice = next(self.var)
+
+                        item_choices.append(choice)
+
+                        self.choices[choice] = (item_id, i, j, mask_id)
+
+                        for t in range(begin, end):
+                            for di, dj in mask:
+                                new_blocked.setdefault(
+                                    (t, i + di, j + dj), []
+                                ).append(choice)
+
+            if item_choices:
+                self.extend_at_most_one(('item', item_id), item_choices)
+                placed = self.extend_or(('item', item_id), item_choices)
+            else:
+                placed = self.or_literals.get(('item', item_id))
+
+            # the item needs to be placed within the current width
+            if placed is None:
+                self.add_clause([stage])
+            else:
+                self.add_clause([placed, stage])
+
+        for cell, cell_choices in new_blocked.items():
+            self.extend_at_most_one(cell, cell_choices)
+
+        if self.use_cardinality:
+            for cell, cell_choices in new_blocked.items():
+                in_use_var = self.in_use.get(cell)
+                if in_use_var is None:
+                    in_use_var = self.in_use[cell] = next(self.var)
+                for choice in cell_choices:
+                    self.add_clause([-choice, in_use_var])
+
+            # positions that are in use need to be covered by a choice, as
+            # this depends on the choices added so far, it is repeated for
+            # every stage
+            for cell, in_use_var in self.in_use.items():
+                if cell in new_blocked:
+                    covered = self.extend_or(cell, new_blocked[cell])
+                else:
+                    covered = self.or_literals[cell]
+                self.add_clause([-in_use_var, covered, stage])
+
+            # the cardinality constraints are rebuilt for the new width
+            for t, use_count in enumerate(self.pos_used):
+                # positions not covered by any choice are never in use
+                in_use = [
+                    self.in_use[(t, i, j)]
+                    for j in range(self.width)
+                    for i in range(self.height)
+                    if (t, i, j) in self.in_use
+                ]
+                self.cardinality_constraint(
+                    in_use, use_count, use_count, relax=stage)
+
+        print(
+            f'width {self.width}: used {self.clauses} clauses and '
+            f'{self.var.used} variables')
+
+    def iter_solutions(self):
+        """Find an optimal solution by increasing the width until feasible.
+
+        Yields:
+            The optimal solution as ``(width, placements)`` tuple. When the
+            given ``start_width`` is feasible, its solution is yielded instead,
+            which isn't proven optimal.
+        """
+        print("optimizing...")
+        while True:
+            if self.lower >= self.max_width:
+                print("no solution within the maximal width")
+                return
+
+            if self.lower + 1 >= self.upper:
+                print(f"optimal width {self.upper}")
+                yield self.best_solution
+                return
+
+            if self.deadline is None:
+                self.solver.set_terminate(None)
+            else:
+                if time.clock_gettime(time.CLOCK_MONOTONIC) >= self.deadline:
+                    raise DeadlineExceeded()
+                deadline = self.deadline
+                self.solver.set_terminate(
+                    lambda: time.clock_gettime(
+                        time.CLOCK_MONOTONIC) >= deadline)
+
+            self.solver.assume(-self.stage)
+            result = self.solver.solve()
+
+            if result is None:
+                raise DeadlineExceeded()
+
+            if result:
+                # the solution may not use all columns
+                placements = self.placements()
+                width = placements_width(self.schedule, placements)
+                if width < self.upper:
+                    self.upper = width
+                    self.best_solution = (width, placements)
+                self.write_checkpoint()
+
+                if self.lower + 1 < self.upper:
+                    # columns are never removed, so narrower widths below the
+                    # start width can't be checked
+                    print(f"best width {self.upper}, lower bound "
+                          f"{self.lower + 1}")
+                    yield self.best_solution
+                    return
+                continue
+
+            self.lower = self.width
+            self.write_checkpoint()
+            print(f"new lower bound {self.lower + 1}..{self.upper}")
+
+            if self.width < self.max_width:
+                self.add_columns(self.width + 1)
+
+    def resume(self, path):
+        """Continue an optimization from a checkpoint.
+
+        Columns are added up to the width after the proven lower bound. The
+        best solution of the checkpoint is kept as upper bound and yielded by
+        ``iter_solutions`` once the lower bound reaches it, without solving
+        at that width again.
+
+        Args:
+            path: Checkpoint written by ``write_checkpoint``
+
+        Returns:
+            Whether the checkpoint exists
+        """
+        try:
+            with open(path) as checkpoint_file:
+                state = json.load(checkpoint_file)
+        except FileNotFoundError:
+            return False
+
+        if state['instance'] != self.instance_hash():
+            raise ValueError(f'{path} is a checkpoint of a different instance')
+
+        self.lower = max(self.lower, min(state['lower'], self.max_width))
+        if self.lower >= self.width:
+            self.add_columns(min(self.lower + 1, self.max_width))
+
+        placements = [tuple(choice) for choice in state['placements']]
+        if placements:
+            width = placements_width(self.schedule, placements)
+        if placements and self.lower < width < self.upper:
+            self.upper = width
+            self.best_solution = (width, placements)
+
+        print(f"resumed at {self.lower + 1}..{self.upper}")
+        return True
@@ -1,15 +1,22 @@
 from itertools import count, islice, combinations
 from sorting_network import sorting_network
+from array import array
 import time
 import json
 import math
+import gzip
+import os
 import subprocess
 import tempfile
 
+from solution import solution_grid, placements_width, write_solution
+from schedule import compress_schedule
+
 
 class PackingSolverIp:
     def __init__(
-            self, schedule, height, max_width, use_cardinality):
+            self, schedule, height, max_width, use_cardinality,
+            compress_steps=True):
         """Generate an IP instance of the block packing example.
 
         Args:
@@ -17,18 +24,37 @@ class PackingSolverIp:
             height: The fixed height of the packing area
             max_width: Upper bound on the width of the packing area
             use_cardinality: Constrain the number of used cells per time step
+            compress_steps: Encode runs of steps with the same items present
+                only once, see ``schedule.compress_schedule``
         """
 
         self.schedule = schedule
 
-        self.choice_vars = set()
+        # the model uses the compressed schedule, the original one is used for
+        # the solution output
+        if compress_steps:
+            schedule = compress_schedule(schedule)
+        self.model_schedule = schedule
 
         self.height = height
         self.max_width = max_width
 
+        # Columns are identified by their index. The constraint matrix is
+        # stored column major, for each column we keep the rows and
+        # coefficients of its nonzero entries.
+        self.column_names = []
+        self.column_rows = []
+        self.column_coefs = []
+
+        # sense and right hand side of each row
+        self.row_senses = []
+        self.row_rhs = array('l')
+
         # map indicator variables to choices
         self.choices = {}
-        self.constraints = []
+
+        # map time steps and positions to the in use variable of that cell
+        self.in_use = {}
 
         self.steps = max(end for begin, end, shape in schedule)
 
@@ -55,10 +81,15 @@ class PackingSolverIp:
 
                         # indicator variable for this item position and
                         # orientation
-                        choice = f'c_{item_id}_{i}_{j}_{mask_id}'
+                        choice = self.add_column(
+                            f'c_{item_id}_{i}_{j}_{mask_id}')
 
                         item_choices.append(choice)
 
+                        # remember this variable for processing a found
+                        # solution
+                        self.choices[choice] = (item_id, i, j, mask_id)
+
                         # add the choice variable to every time step and
                         # position used by this choice
                         for t in range(begin, end):
@@ -68,9 +99,7 @@ class PackingSolverIp:
                                 ).append(choice)
 
             # we need to select exactly one choice for this item
-            self.constraints.append(
-                ([(1, c) for c in item_choices], 'E', 1)
-            )
+            self.add_row('E', 1, (1, item_choices))
 
         if use_cardinality:
             for t, use_count in enumerate(pos_used):
@@ -79,25 +108,23 @@ class PackingSolverIp:
                 in_use = []
                 for j in range(0, max_width):
                     for i in range(0, height):
-                        in_use_var = f'f_{t}_{j}_{i}'
+                        in_use_var = self.add_column(f'f_{t}_{j}_{i}')
                         in_use.append(in_use_var)
+                        self.in_use[(t, i, j)] = in_use_var
                         blocking_choices = blocked[(t, i, j)]
                         for choice in blocking_choices:
-                            self.constraints.append(
-                                ([(-1, choice), (1, in_use_var)], 'G', 0)
-                            )
+                            self.add_row(
+                                'G', 0, (-1, [choice]), (1, [in_use_var]))
 
-                        self.constraints.append(([
-                            (-1, in_use_var),
-                            *[(1, c) for c in blocking_choices]
-                        ], 'G', 0))
+                        self.add_row(
+                            'G', 0, (-1, [in_use_var]), (1, blocking_choices))
 
-                self.constraints.append(
-                    ([(1, v) for v in in_use], 'E', use_count))
+                self.add_row('E', use_count, (1, in_use))
 
         # to optimize the width used, we add variables that block positions on
         # the right
-        self.block_vars = [f'b_{j}' for j in range(max_width)]
+        self.block_vars = [
+            self.add_column(f'b_{j}') for j in range(max_width)]
 
         for j, block_var in enumerate(self.block_vars):
             for i in range(0, height):
@@ -107,53 +134,254 @@ class PackingSolverIp:
         # we also add impliciations from block_var[i] to block_var[i + 1], so
         # everything to the right of i is also automatically blocked
         for i in range(len(self.block_vars) - 1):
-            self.constraints.append((
-                [(-1, self.block_vars[i]), (1, self.block_vars[i + 1])],
-                'G', 0
-            ))
+            self.add_row(
+                'G', 0,
+                (-1, [self.block_vars[i]]), (1, [self.block_vars[i + 1]]))
 
-        self.constraints.append((
-            [(1, 'b'), *[(1, v) for v in self.block_vars]],
-            'E', self.max_width
-        ))
+        # the width is the only general integer variable and the objective
+        self.width_var = self.add_column('b')
+
+        self.add_row(
+            'E', self.max_width, (1, [self.width_var]), (1, self.block_vars))
 
         # now we make sure that only one item uses a position and time step
         for blocked_list in blocked.values():
-            self.constraints.append(
-                ([(1, v) for v in blocked_list], 'L', 1))
-
-    def optimize(self):
-        """Optimize the resulting IP instance using the CBC solver."""
-        with tempfile.NamedTemporaryFile('w', suffix='.mps') as mps_file:
-            def out(*args, **kwargs):
-                print(*args, **kwargs, file=mps_file)
-
-            out('NAME TESTPROB')
-            out('ROWS')
-            out(' N width')
-            by_column = {}
-            for i, (vs, k, c) in enumerate(self.constraints):
-                out(f' {k} R{i}')
-                for (v, col) in vs:
-                    by_column.setdefault(col, []).append((v, i))
-            out('COLUMNS')
-            for col, vs in by_column.items():
-                # out(f'    {col}', end='')
-                for (v, i) in vs:
-                    out(f'    {col} R{i} {v}')
-                if col == 'b':
-                    out('    b width 1')
-                # out()
-            out('RHS')
-            for i, (vs, k, c) in enumerate(self.constraints):
-                out(f'    RHS1 R{i} {c}')
-            out('BOUNDS')
-            for col in by_column.keys():
-                if col != 'b':
-                    out(f' BV BND1 {col}')
+            self.add_row('L', 1, (1, blocked_list))
+
+    def add_column(self, name):
+        """Add a column and return its index."""
+        self.column_names.append(name)
+        self.column_rows.append(array('l'))
+        self.column_coefs.append(array('l'))
+        return len(self.column_names) - 1
+
+    def add_row(self, sense, rhs, *terms):
+        """Add a row given as groups of columns sharing a coefficient.
+
+        Args:
+            sense: One of 'E', 'L' or 'G'
+            rhs: Right hand side of the constraint
+            terms: ``(coef, columns)`` tuples
+        """
+        row = len(self.row_senses)
+        self.row_senses.append(sense)
+        self.row_rhs.append(rhs)
+
+        column_rows = self.column_rows
+        column_coefs = self.column_coefs
+        for coef, columns in terms:
+            for column in columns:
+                column_rows[column].append(row)
+                column_coefs[column].append(coef)
+
+    def write_mps(self, path, fixed=False):
+        """Write the instance as MPS file.
+
+        Files ending in ``.gz`` are gzip compressed. By default the free MPS
+        format using the descriptive column names is written. The fixed format
+        limits names to 8 characters, so columns are named by their index
+        instead.
+
+        Args:
+            path: Output file name
+            fixed: Use the fixed instead of the free MPS format
+        """
+
+        # All names are padded and formatted once per row or column, every
+        # nonzero entry then is a concatenation of preformatted strings.
+        if fixed:
+            assert len(self.column_names) < 10 ** 7
+            assert len(self.row_senses) < 10 ** 7
+            column_names = [
+                f'    C{column:<7d}  '
+                for column in range(len(self.column_names))]
+            row_names = [
+                f'R{row:<7d}  ' for row in range(len(self.row_senses))]
+            objective = 'WIDTH     '
+        else:
+            column_names = [f'    {name} ' for name in self.column_names]
+            row_names = [
+                f'R{row} ' for row in range(len(self.row_senses))]
+            objective = 'WIDTH '
+
+        coef_strings = {}
+
+        def coef_string(coef):
+            try:
+                return coef_strings[coef]
+            except KeyError:
+                if fixed:
+                    string = f'{coef:>12d}\n'
                 else:
-                    out(f' LI BND1 {col} 0')
+                    string = f'{coef}\n'
+                coef_strings[coef] = string
+                return string
+
+        if str(path).endswith('.gz'):
+            mps_file = gzip.open(path, 'wt', compresslevel=1)
+        else:
+            mps_file = open(path, 'w', buffering=1 << 20)
+
+        with mps_file:
+            write = mps_file.write
+
+            write('NAME          PACKING\nROWS\n')
+            write(f' N  {objective.rstrip()}\n')
+            write(''.join(
+                f' {sense}  {name.rstrip()}\n'
+                for sense, name in zip(self.row_senses, row_names)))
+
+            write('COLUMNS\n')
+            for column, name in enumerate(column_names):
+                coefs = self.column_coefs[column]
+                chunk = [
+                    name + row_names[row] + coef_string(coef)
+                    for row, coef in zip(self.column_rows[column], coefs)
+                ]
+                if column == self.width_var:
+                    chunk.append(name + objective + coef_string(1))
+                write(''.join(chunk))
+
+            # zero is the default right hand side and not written
+            write('RHS\n')
+            rhs_name = '    RHS       ' if fixed else '    RHS '
+            write(''.join(
+                rhs_name + row_names[row] + coef_string(rhs)
+                for row, rhs in enumerate(self.row_rhs) if rhs
+            ))
+
+            write('BOUNDS\n')
+            bound_prefix = ' BV BND       ' if fixed else ' BV BND '
+            write(''.join(
+                bound_prefix + name.lstrip() + '\n'
+                for column, name in enumerate(column_names)
+                if column != self.width_var
+            ))
+            width_name = column_names[self.width_var].lstrip()
+            if fixed:
+                write(f' LI BND       {width_name}{0:>12d}\n')
+            else:
+                write(f' LI BND {width_name}0\n')
+
+            write('ENDATA\n')
+
+    def start_values(self, placements):
+        """Values of all nonzero columns for a packing given as placements.
+
+        The width is the smallest width that fits all placements.
+        """
+        values = {}
+        width = placements_width(self.schedule, placements)
+        choice_vars = {choice: var for var, choice in self.choices.items()}
+
+        for placement in placements:
+            values[choice_vars[tuple(placement)]] = 1
+
+            item_id, i, j, mask_id = placement
+            begin, end, shape = self.model_schedule[item_id]
+            for di, dj in shape[mask_id]:
+                for t in range(begin, end):
+                    in_use_var = self.in_use.get((t, i + di, j + dj))
+                    if in_use_var is not None:
+                        values[in_use_var] = 1
+
+        for block_var in self.block_vars[width:]:
+            values[block_var] = 1
+        values[self.width_var] = width
+
+        return values
+
+    def write_mip_start(self, path, placements):
+        """Write a packing as a Cbc solution file usable as MIP start."""
+        values = self.start_values(placements)
+
+        with open(path, 'w') as start_file:
+            start_file.write(
+                f'Stopped on iterations - objective value '
+                f'{values[self.width_var]}\n')
+            start_file.write(''.join(
+                f'{column} {name} {values.get(column, 0)}\n'
+                for column, name in enumerate(self.column_names)
+            ))
+
+    def read_cbc_solution(self, path):
+        """Parse a solution file written by Cbc.
+
+        Returns:
+            A ``(status, placements)`` tuple where status is the first word of
+            Cbc's status line and placements is None when the file contains no
+            solution.
+        """
+        with open(path) as solution_file:
+            status = solution_file.readline().split()
+            status = status[0] if status else 'Unknown'
+
+            if status == 'Infeasible' or status == 'Unknown':
+                return status, None
+
+            placements = []
+            for line in solution_file:
+                # Cbc marks values violating bounds or integrality with
+                # asterisks
+                fields = line.replace('**', ' ').split()
+                if len(fields) < 3:
+                    continue
+                column = int(fields[0])
+                if round(float(fields[2])) == 1 and column in self.choices:
+                    placements.append(self.choices[column])
+
+        if len(placements) != len(self.schedule):
+            return status, None
+
+        return status, placements
+
+    def optimize(
+            self, threads=None, time_limit=None, mip_start=None, cbc='cbc'):
+        """Optimize the resulting IP instance using the CBC solver.
+
+        A found solution is written to ``solution_$width.json`` in the current
+        directory.
+
+        Args:
+            threads: Number of threads used by Cbc
+            time_limit: Time limit in seconds
+            mip_start: Placements of a known packing to start from
+            cbc: The Cbc executable to run
+
+        Returns:
+            A ``(status, width)`` tuple, where width is None when no solution
+            was found.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            mps_file = os.path.join(tmp_dir, 'packing.mps')
+            start_file = os.path.join(tmp_dir, 'start.sol')
+            solution_file = os.path.join(tmp_dir, 'packing.sol')
+
+            self.write_mps(mps_file)
+
+            command = [cbc, mps_file]
+            if threads is not None:
+                command += ['-threads', str(threads)]
+            if time_limit is not None:
+                command += ['-sec', str(time_limit)]
+            if mip_start is not None:
+                self.write_mip_start(start_file, mip_start)
+                command += ['-mips', start_file]
+            command += ['-solve', '-solu', solution_file]
+
+            subprocess.check_call(command)
+
+            status, placements = self.read_cbc_solution(solution_file)
+
+        if placements is None:
+            print(f'no solution found ({status})')
+            return status, None
 
-            out('ENDATA', flush=True)
+        width = placements_width(self.schedule, placements)
+        self.save_solution(width, placements)
+        print(f'found width {width} ({status})')
+        return status, width
 
-            subprocess.check_call(['cbc', mps_file.name])
+    def save_solution(self, width, placements):
+        write_solution(width, solution_grid(
+            self.schedule, self.height, width, placements))
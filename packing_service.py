@@ -0,0 +1,352 @@
+"""Long running packing service with a pool of pre-warmed workers.
+
+Starting a new ``demo.py`` process for every schedule pays for the Python
+startup and for loading ``libcadical.so`` each time. This service keeps a fixed
+number of worker processes around that have the solver library already loaded
+and hands them schedules received over a Unix socket or a local TCP port.
+
+The protocol is line based JSON. A client sends a single job object
+
+    {"schedule": [[begin, end, shape], ...], "height": 5, "max_width": 20,
+     "time_limit": 60, "use_cardinality": true, "at_most_one": "product"}
+
+where ``shape`` is either an index into ``shapes.well_known_shapes`` or a full
+list of orientations. The service answers with one event object per line:
+
+    {"event": "queued", "job": 3}
+    {"event": "bounds", "lower": 5, "upper": 9}
+    {"event": "solution", "width": 9, "solution": [...]}
+    {"event": "done", "lower": 7, "upper": 8, "optimal": true}
+
+Bounds use the same convention as ``PackingSolver``: ``lower`` is the largest
+width proven to be infeasible, ``upper`` the smallest width found so far. When
+the job queue is full the job is rejected right away with a ``rejected`` event
+instead of piling up work. Jobs that fail or whose worker process dies produce
+an ``error`` event, as do lines that aren't a valid job.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import socketserver
+import threading
+import time
+from itertools import count
+
+from shapes import well_known_shapes
+from solution import solution_grid
+
+
+def parse_schedule(schedule):
+    """Convert a JSON schedule into the format used by the solvers."""
+    parsed = []
+    for begin, end, shape in schedule:
+        if isinstance(shape, int):
+            shape = well_known_shapes[shape]
+        parsed.append((begin, end, shape))
+    return parsed
+
+
+def check_job(job):
+    """Check the fields of a job needed for queueing it.
+
+    Returns:
+        An error message or None if the job is fine
+    """
+    if not isinstance(job, dict):
+        return 'job is not a JSON object'
+
+    for field in ('schedule', 'height', 'max_width'):
+        if field not in job:
+            return f'job is missing {field!r}'
+
+    time_limit = job.get('time_limit', 0)
+    if isinstance(time_limit, bool) or not isinstance(
+            time_limit, (int, float)) or not time_limit >= 0:
+        return 'time_limit is not a non-negative number'
+
+    return None
+
+
+def _run_job(job_id, job, events):
+    from packing import PackingSolver, DeadlineExceeded
+
+    deadline = time.monotonic() + job['time_limit']
+
+    def send(event, **kwargs):
+        events.put({'job': job_id, 'event': event, **kwargs})
+
+    class ServiceSolver(PackingSolver):
+        # Report bound changes back to the service.
+
+        def solve(self, width, timeout=None):
+            bounds = (self.lower, self.upper)
+            result = super().solve(width, timeout=timeout)
+            if (self.lower, self.upper) != bounds:
+                send('bounds', lower=self.lower, upper=self.upper)
+            return result
+
+    solver = ServiceSolver(
+        parse_schedule(job['schedule']),
+        job['height'], job['max_width'],
+        use_cardinality=job.get('use_cardinality', True),
+        at_most_one=job.get('at_most_one', 'product'),
+    )
+    solver.deadline = deadline
+
+    try:
+        for width, placements in solver.iter_solutions():
+            send('solution', width=width, solution=solution_grid(
+                solver.schedule, solver.height, width, placements))
+    except DeadlineExceeded:
+        pass
+
+    send(
+        'done', lower=solver.lower, upper=solver.upper,
+        optimal=solver.lower + 1 >= solver.upper)
+
+
+def _worker(index, jobs, events):
+    # Importing the solver loads libcadical.so, so do it before the first job
+    # arrives.
+    import packing  # noqa: F401
+
+    # the service shuts down the workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    while True:
+        job_id, job = jobs.get()
+        # lets the service report an error for the job if this worker dies
+        events.put({'job': job_id, 'event': 'started', 'worker': index})
+        try:
+            _run_job(job_id, job, events)
+        except Exception as err:
+            events.put({'job': job_id, 'event': 'error', 'message': str(err)})
+
+
+class PackingService:
+    def __init__(self, workers=None, queue_size=16, time_limit=600):
+        """Start the worker pool.
+
+        Args:
+            workers: Number of worker processes (defaults to the CPU count)
+            queue_size: Number of jobs that can wait for a free worker
+            time_limit: Default and maximal time limit of a job in seconds
+        """
+        self.time_limit = time_limit
+        self.job_ids = count(1)
+
+        self.jobs = multiprocessing.Queue(queue_size)
+        self.events = multiprocessing.Queue()
+
+        # per job queue of events for the connection that submitted the job
+        self.listeners = {}
+        self.listeners_lock = threading.Lock()
+
+        # the job each worker is running
+        self.running = {}
+
+        self.workers = [
+            self._start_worker(index)
+            for index in range(workers or os.cpu_count())
+        ]
+
+        self.dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self.dispatcher.start()
+
+    def _start_worker(self, index):
+        worker = multiprocessing.Process(
+            target=_worker, args=(index, self.jobs, self.events), daemon=True)
+        worker.start()
+        return worker
+
+    def _dispatch(self):
+        while True:
+            try:
+                self._forward(self.events.get(timeout=1))
+            except queue.Empty:
+                pass
+
+            if all(worker.is_alive() for worker in self.workers):
+                continue
+
+            # process the events a dead worker sent before it died first
+            while True:
+                try:
+                    self._forward(self.events.get_nowait())
+                except queue.Empty:
+                    break
+
+            for index, worker in enumerate(self.workers):
+                if worker.is_alive():
+                    continue
+                job_id = self.running.pop(index, None)
+                if job_id is not None:
+                    self._forward({
+                        'job': job_id, 'event': 'error',
+                        'message': f'worker exited with code '
+                        f'{worker.exitcode}'})
+                self.workers[index] = self._start_worker(index)
+
+    def _forward(self, event):
+        if event['event'] == 'started':
+            self.running[event['worker']] = event['job']
+            return
+        if event['event'] in ('done', 'error'):
+            for index, job_id in list(self.running.items()):
+                if job_id == event['job']:
+                    del self.running[index]
+
+        with self.listeners_lock:
+            listener = self.listeners.get(event['job'])
+        if listener is not None:
+            listener.put(event)
+
+    def close(self):
+        """Stop all worker processes."""
+        for worker in self.workers:
+            worker.terminate()
+        for worker in self.workers:
+            worker.join()
+
+    def submit(self, job):
+        """Queue a job, yielding the events produced for it.
+
+        The first event is either ``queued`` or ``rejected``. The events end
+        with a ``done``, ``error`` or ``rejected`` event. A job that isn't
+        valid produces a single ``error`` event without being queued.
+        """
+        message = check_job(job)
+        if message is not None:
+            yield {'event': 'error', 'message': message}
+            return
+
+        job_id = next(self.job_ids)
+
+        time_limit = job.get('time_limit', self.time_limit)
+        job = dict(job, time_limit=min(time_limit, self.time_limit))
+
+        listener = queue.Queue()
+        with self.listeners_lock:
+            self.listeners[job_id] = listener
+
+        try:
+            try:
+                self.jobs.put_nowait((job_id, job))
+            except queue.Full:
+                yield {'job': job_id, 'event': 'rejected',
+                       'message': 'job queue is full'}
+                return
+
+            yield {'job': job_id, 'event': 'queued'}
+
+            while True:
+                event = listener.get()
+                yield event
+                if event['event'] in ('done', 'error'):
+                    return
+        finally:
+            with self.listeners_lock:
+                del self.listeners[job_id]
+
+    def serve(self, address):
+        """Accept jobs on a Unix socket path or a ``(host, port)`` tuple."""
+        service = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+                    try:
+                        job = json.loads(line)
+                    except ValueError as err:
+                        events = [{'event': 'error', 'message': str(err)}]
+                    else:
+                        events = service.submit(job)
+                    for event in events:
+                        self.wfile.write(json.dumps(event).encode() + b'\n')
+                        self.wfile.flush()
+
+        if isinstance(address, tuple):
+            server_class = socketserver.ThreadingTCPServer
+        else:
+            server_class = socketserver.ThreadingUnixStreamServer
+            if os.path.exists(address):
+                os.unlink(address)
+
+        server_class.daemon_threads = True
+        server_class.allow_reuse_address = True
+
+        with server_class(address, Handler) as server:
+            server.serve_forever()
+
+
+def request(address, job):
+    """Submit a job to a running service, yielding the events received."""
+    if isinstance(address, tuple):
+        connection = socket.create_connection(address)
+    else:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(address)
+
+    with connection, connection.makefile('rwb') as stream:
+        stream.write(json.dumps(job).encode() + b'\n')
+        stream.flush()
+        connection.shutdown(socket.SHUT_WR)
+        for line in stream:
+            yield json.loads(line)
+
+
+def _terminate(signum, frame):
+    raise KeyboardInterrupt()
+
+
+def main():
+    # stop the workers on SIGINT and SIGTERM
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, _terminate)
+
+    parser = argparse.ArgumentParser(
+        description='serve packing requests using pre-warmed workers')
+    parser.add_argument('--socket', type=str,
+                        help='path of the Unix socket to listen on')
+    parser.add_argument('--port', type=int,
+                        help='local TCP port to listen on')
+    parser.add_argument('--workers', type=int,
+                        help='number of worker processes')
+    parser.add_argument('--queue-size', type=int, default=16,
+                        help='number of jobs waiting before new ones are '
+                        'rejected')
+    parser.add_argument('--time-limit', type=float, default=600,
+                        help='default and maximal time limit per job')
+
+    args = parser.parse_args()
+
+    if (args.socket is None) == (args.port is None):
+        parser.error('exactly one of --socket and --port is required')
+
+    if args.socket is not None:
+        address = args.socket
+    else:
+        address = ('127.0.0.1', args.port)
+
+    service = PackingService(
+        workers=args.workers,
+        queue_size=args.queue_size,
+        time_limit=args.time_limit,
+    )
+    try:
+        service.serve(address)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,74 +3,45 @@
 This requires a shared library build of libcadical. See also
 ``build_libcadical.sh``.
 
-By using CFFI this is compatible with cpython as well as pypy.
+By using CFFI this is compatible with cpython as well as pypy. When the
+``_pycadical`` extension module built by ``pycadical_build.py`` is available it
+is used, otherwise ``libcadical.so`` is loaded at runtime.
 """
-from cffi import FFI
 import os
 
+try:
+    from _pycadical import ffi as _ffi, lib as _lib
+except ImportError:
+    # The compiled bindings weren't built, so fall back to loading
+    # libcadical.so at runtime, which is slower but needs no C compiler.
+    from cffi import FFI
+    from pycadical_build import cdef
+
+    _ffi = FFI()
+    _ffi.cdef(cdef)
+
+    try:
+        _lib = _ffi.dlopen(
+            os.path.join(
+                os.path.dirname(os.path.abspath(__file__)),
+                "libcadical.so"
+            )
+        )
+    except OSError as err:
+        raise RuntimeError(
+            "libcadical.so not found, run ./build_libcadical.sh"
+        ) from err
 
-_ffi = FFI()
-
-""" The declarations below are copied from the CaDiCaL source code licensed as:
-MIT License
-
-Copyright (c) 2016-2019 Armin Biere, Johannes Kepler University Linz, Austria
-
-Permission is hereby granted, free of charge, to any person obtaining a copy
-of this software and associated documentation files (the "Software"), to deal
-in the Software without restriction, including without limitation the rights
-to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
-copies of the Software, and to permit persons to whom the Software is
-furnished to do so, subject to the following conditions:
-
-The above copyright notice and this permission notice shall be included in all
-copies or substantial portions of the Software.
-
-THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
-IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
-FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
-AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
-LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
-OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
-SOFTWARE.
-"""
-
-_ffi.cdef("""
-// C wrapper for CaDiCaL's C++ API following IPASIR.
-
-typedef struct CCaDiCaL CCaDiCaL;
-
-const char * ccadical_signature (void);
-CCaDiCaL * ccadical_init (void);
-void ccadical_release (CCaDiCaL *);
-
-void ccadical_add (CCaDiCaL *, int lit);
-void ccadical_assume (CCaDiCaL *, int lit);
-int ccadical_solve (CCaDiCaL *);
-int ccadical_val (CCaDiCaL *, int lit);
-int ccadical_failed (CCaDiCaL *, int lit);
-
-void ccadical_set_terminate (CCaDiCaL *,
-  void * state, int (*terminate)(void * state));
-
-/*------------------------------------------------------------------------*/
-
-// Non-IPASIR conformant 'C' functions.
+    compiled = False
 
-void ccadical_set_option (CCaDiCaL *, const char * name, double val);
-void ccadical_limit (CCaDiCaL *, const char * name, long limit);
-int ccadical_get_option (CCaDiCaL *, const char * name);
-void ccadical_print_statistics (CCaDiCaL *);
-long ccadical_active (CCaDiCaL *);
-long ccadical_irredundant (CCaDiCaL *);
-int ccadical_fixed (CCaDiCaL *, int lit);
-void ccadical_terminate (CCaDiCaL *);
-void ccadical_freeze (CCaDiCaL *, int lit);
-int ccadical_frozen (CCaDiCaL *, int lit);
-void ccadical_melt (CCaDiCaL *, int lit);
-int ccadical_simplify (CCaDiCaL *);
+    def _add_literals(solver, lits, count):
+        for lit in lits:
+            _lib.ccadical_add(solver, lit)
+else:
+    compiled = True
 
-""")
+    _add_literals = _lib.pycadical_add_literals
+    _values = _lib.pycadical_values
 
 
 @_ffi.callback("int(void *)")
@@ -78,18 +49,6 @@ def _terminate_callback(state):
     return _ffi.from_handle(state)()
 
 
-try:
-    _lib = _ffi.dlopen(
-        os.path.join(
-            os.path.dirname(os.path.abspath(__file__)),
-            "libcadical.so"
-        )
-    )
-except OSError as err:
-    raise RuntimeError(
-        "libcadical.so not found, run ./build_libcadical.sh"
-    ) from err
-
 version = _ffi.string(_lib.ccadical_signature())
 
 _status_to_bool = {0: None, 10: True, 20: False}
@@ -164,9 +123,30 @@ class Solver:
         _lib.ccadical_simplify(self.__solver, lit)
 
     def add_clause(self, lits):
-        for lit in lits:
-            self.add(lit)
-        self.add(0)
+        lits = [*lits, 0]
+        _add_literals(self.__solver, lits, len(lits))
+
+    def add_clauses(self, clauses):
+        """Add multiple clauses using a single call into the solver."""
+        lits = []
+        for clause in clauses:
+            lits.extend(clause)
+            lits.append(0)
+        _add_literals(self.__solver, lits, len(lits))
+
+    def values(self, lits):
+        """Values of multiple literals, like calling ``val`` for each."""
+        if not compiled:
+            # filling a cdata array from Python is slower than looking up each
+            # value directly
+            solver = self.__solver
+            val = _lib.ccadical_val
+            return [_value_to_bool[val(solver, lit)] for lit in lits]
+
+        lits = list(lits)
+        values = _ffi.new("signed char[]", len(lits))
+        _values(self.__solver, lits, values, len(lits))
+        return [_value_to_bool[value] for value in values]
 
 
 __all__ = ['Solver']
@@ -0,0 +1,112 @@
+"""Build script for the compiled CFFI bindings of the cadical SAT solver.
+
+Running this after building ``libcadical.so`` compiles the ``_pycadical``
+extension module next to it. This is done by ``build_libcadical.sh``. When the
+extension module is available ``pycadical.py`` uses it instead of loading
+``libcadical.so`` at runtime, which avoids the overhead of libffi's generic
+calling convention for every call into the solver.
+
+Apart from the functions of CaDiCaL's C API, the extension contains helpers
+that add a batch of literals or read back the values of many literals using a
+single call.
+"""
+from cffi import FFI
+
+""" The declarations below are copied from the CaDiCaL source code licensed as:
+MIT License
+
+Copyright (c) 2016-2019 Armin Biere, Johannes Kepler University Linz, Austria
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+cdef = """
+// C wrapper for CaDiCaL's C++ API following IPASIR.
+
+typedef struct CCaDiCaL CCaDiCaL;
+
+const char * ccadical_signature (void);
+CCaDiCaL * ccadical_init (void);
+void ccadical_release (CCaDiCaL *);
+
+void ccadical_add (CCaDiCaL *, int lit);
+void ccadical_assume (CCaDiCaL *, int lit);
+int ccadical_solve (CCaDiCaL *);
+int ccadical_val (CCaDiCaL *, int lit);
+int ccadical_failed (CCaDiCaL *, int lit);
+
+void ccadical_set_terminate (CCaDiCaL *,
+  void * state, int (*terminate)(void * state));
+
+/*------------------------------------------------------------------------*/
+
+// Non-IPASIR conformant 'C' functions.
+
+void ccadical_set_option (CCaDiCaL *, const char * name, double val);
+void ccadical_limit (CCaDiCaL *, const char * name, long limit);
+int ccadical_get_option (CCaDiCaL *, const char * name);
+void ccadical_print_statistics (CCaDiCaL *);
+long ccadical_active (CCaDiCaL *);
+long ccadical_irredundant (CCaDiCaL *);
+int ccadical_fixed (CCaDiCaL *, int lit);
+void ccadical_terminate (CCaDiCaL *);
+void ccadical_freeze (CCaDiCaL *, int lit);
+int ccadical_frozen (CCaDiCaL *, int lit);
+void ccadical_melt (CCaDiCaL *, int lit);
+int ccadical_simplify (CCaDiCaL *);
+"""
+
+helpers_cdef = """
+void pycadical_add_literals (CCaDiCaL *, const int * lits, size_t count);
+void pycadical_values (
+  CCaDiCaL *, const int * lits, signed char * values, size_t count);
+"""
+
+helpers_source = """
+// Add all literals of one or more zero terminated clauses.
+static void pycadical_add_literals (
+    CCaDiCaL * solver, const int * lits, size_t count) {
+  for (size_t i = 0; i < count; i++)
+    ccadical_add (solver, lits[i]);
+}
+
+// Store the values of the given literals as 1 (true), -1 (false) or 0.
+static void pycadical_values (
+    CCaDiCaL * solver, const int * lits, signed char * values, size_t count) {
+  for (size_t i = 0; i < count; i++) {
+    int value = ccadical_val (solver, lits[i]);
+    values[i] = (value > 0) - (value < 0);
+  }
+}
+"""
+
+ffibuilder = FFI()
+ffibuilder.cdef(cdef + helpers_cdef)
+ffibuilder.set_source(
+    "_pycadical",
+    cdef + helpers_source,
+    libraries=["cadical"],
+    library_dirs=["."],
+    # find libcadical.so next to the extension module
+    extra_link_args=["-Wl,-rpath,$ORIGIN"],
+)
+
+
+if __name__ == "__main__":
+    ffibuilder.compile(verbose=True)
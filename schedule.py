@@ -0,0 +1,24 @@
+"""Transformations of schedules that preserve the packing problem."""
+
+
+def compress_schedule(schedule):
+    """Merge consecutive time steps that have the same items present.
+
+    Only the steps where an item begins or ends change the set of present
+    items. All steps from one such step up to the next are replaced by a
+    single step, as any placement of the items is valid for all of them or for
+    none. Steps before the first item begins are dropped.
+
+    As placements don't depend on the time steps, a packing of the compressed
+    schedule is a packing of the original schedule with the same item ids.
+    """
+    boundaries = sorted(
+        {begin for begin, end, shape in schedule} |
+        {end for begin, end, shape in schedule}
+    )
+    index = {step: i for i, step in enumerate(boundaries)}
+
+    return [
+        (index[begin], index[end], shape)
+        for begin, end, shape in schedule
+    ]
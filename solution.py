@@ -0,0 +1,207 @@
+"""Conversion between placements and solution grids.
+
+A placement of an item is a ``(item_id, i, j, mask_id)`` tuple giving the
+position of the item's top left corner and its orientation. Solution files
+contain, for each time step, a grid with the id of the item occupying each
+cell or ``None``.
+"""
+import collections
+import json
+import os
+import signal
+import sys
+import threading
+
+
+def solution_grid(schedule, height, width, placements):
+    """Build the per step grid of item ids for the given placements."""
+    steps = max(end for begin, end, shape in schedule)
+
+    output = [
+        [[None] * width for _ in range(height)]
+        for _ in range(steps)
+    ]
+
+    for item_id, i, j, mask_id in placements:
+        begin, end, shape = schedule[item_id]
+
+        for di, dj in shape[mask_id]:
+            for t in range(begin, end):
+                assert output[t][i + di][j + dj] is None
+                output[t][i + di][j + dj] = item_id
+
+    return output
+
+
+def placements_width(schedule, placements):
+    """Smallest width that fits all placements."""
+    return max(
+        j + dj + 1
+        for item_id, i, j, mask_id in placements
+        for di, dj in schedule[item_id][2][mask_id]
+    )
+
+
+def grid_placements(schedule, grid):
+    """Recover the placements of all items from a solution grid."""
+    # it's enough to look at the first step of every item
+    starting = {}
+    for item_id, (begin, end, shape) in enumerate(schedule):
+        starting.setdefault(begin, set()).add(item_id)
+
+    cells = {item_id: [] for item_id in range(len(schedule))}
+
+    for t, item_ids in starting.items():
+        for i, row in enumerate(grid[t]):
+            for j, item_id in enumerate(row):
+                if item_id in item_ids:
+                    cells[item_id].append((i, j))
+
+    placements = []
+    for item_id, item_cells in cells.items():
+        shape = schedule[item_id][2]
+        i = min(i for i, j in item_cells)
+        j = min(j for i, j in item_cells)
+        mask = sorted((ci - i, cj - j) for ci, cj in item_cells)
+        mask_id = [sorted(map(tuple, m)) for m in shape].index(mask)
+        placements.append((item_id, i, j, mask_id))
+
+    return placements
+
+
+def write_solution(width, grid, height=None):
+    """Write a grid to ``solution_{width}.json``.
+
+    When a height is given, the grid is written to
+    ``solution_{height}x{width}.json`` instead.
+    """
+    if height is None:
+        file_name = f'solution_{width}.json'
+    else:
+        file_name = f'solution_{height}x{width}.json'
+
+    with open(file_name, 'w') as solution_file:
+        json.dump(grid, solution_file)
+
+
+def read_solution(file_name):
+    with open(file_name) as solution_file:
+        return json.load(solution_file)
+
+
+class SolutionWriter:
+    def __init__(self, schedule, height, limit=4):
+        """Write solution files in a background thread.
+
+        At most limit solutions wait to be written. When solutions are found
+        faster than they can be written, the oldest waiting one is skipped
+        instead of blocking, as it is superseded by the newer ones anyway.
+
+        Args:
+            schedule: The schedule the solutions are for
+            height: Height of the packing area
+            limit: Number of solutions waiting to be written, or None to
+                never skip a solution
+        """
+        self.schedule = schedule
+        self.height = height
+        self.limit = limit
+        self.waiting = collections.deque()
+        self.condition = threading.Condition()
+        self.closed = False
+
+        # the exception raised while writing a file, re-raised by close
+        self.error = None
+
+        with _open_writers_lock:
+            _open_writers.add(self)
+
+        self.thread = threading.Thread(target=self._run)
+        self.thread.start()
+
+    def put(self, width, placements, height=None):
+        """Schedule writing a solution to ``solution_{width}.json``.
+
+        When a height is given, the solution uses that height and is written
+        to ``solution_{height}x{width}.json``, see ``write_solution``.
+        """
+        with self.condition:
+            if self.error is not None:
+                return
+            if self.limit is not None and len(self.waiting) >= self.limit:
+                self.waiting.popleft()
+            self.waiting.append((width, placements, height))
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.waiting and not self.closed:
+                    self.condition.wait()
+                if not self.waiting:
+                    return
+                width, placements, height = self.waiting.popleft()
+
+            try:
+                write_solution(width, solution_grid(
+                    self.schedule, self.height if height is None else height,
+                    width, placements), height=height)
+            except Exception as error:
+                # keep the error for close, put drops all later solutions
+                with self.condition:
+                    self.error = error
+                    self.closed = True
+                    self.waiting.clear()
+                return
+
+    def close(self):
+        """Wait for all waiting solutions to be written.
+
+        Raises the exception of a failed write, if any.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+
+        with _open_writers_lock:
+            _open_writers.discard(self)
+
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Writers that aren't closed yet, these are closed by exit_on_interrupt
+_open_writers = set()
+_open_writers_lock = threading.Lock()
+
+
+def exit_on_interrupt():
+    """Exit on Ctrl-C only after writing all waiting solutions.
+
+    A solver call can run for a long time without returning to Python, so
+    SIGINT can't be handled in the main thread. Instead it is blocked and
+    received by a separate thread, which closes all open ``SolutionWriter``
+    instances and then exits the process. This has to be called before
+    starting any other threads, as they inherit the blocked signal.
+    """
+    signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGINT})
+
+    def wait_for_interrupt():
+        signal.sigwait({signal.SIGINT})
+        with _open_writers_lock:
+            writers = list(_open_writers)
+        for writer in writers:
+            try:
+                writer.close()
+            except Exception as error:
+                print(f'writing a solution failed: {error}', file=sys.stderr)
+        os._exit(128 + signal.SIGINT)
+
+    threading.Thread(target=wait_for_interrupt, daemon=True).start()
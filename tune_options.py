@@ -0,0 +1,281 @@
+"""Tuning of CaDiCaL's options for the instances of a corpus.
+
+CaDiCaL's default options are chosen to work well for a broad range of
+problems. This tool searches for options that work better for the CNFs
+generated by ``PackingSolver``. Random configurations are compared using
+successive halving: every configuration is run on a few instances of a corpus
+(see ``corpus.py``), the better half is kept and run on twice as many
+instances and so on, until a single configuration is left, all instances are
+used or the time budget is exhausted.
+
+Each run searches for the optimal width. A run is scored by the time taken,
+where runs that didn't finish within the time limit count as twice the time
+limit. The best configuration is written as a named profile
+
+    {"name": "packing", "options": {"chrono": 0, ...}, "mean_time": 1.2, ...}
+
+which contains only the options that differ from CaDiCaL's defaults. It can be
+used by passing ``--profile`` to ``demo.py`` or by passing the options loaded
+using ``load_profile`` to ``PackingSolver``.
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import time
+from random import Random
+
+from corpus import load_index, load_schedule
+
+# Candidate values for each tuned option, CaDiCaL's default is added when
+# missing, see default_options
+search_space = {
+    'restart': [0, 1],
+    'restartint': [2, 10, 50, 200],
+    'restartmargin': [0, 10, 25],
+    'chrono': [0, 1, 2],
+    'phase': [0, 1],
+    'stabilize': [0, 1],
+    'rephase': [0, 1],
+    'elim': [0, 1],
+    'subsume': [0, 1],
+    'probe': [0, 1],
+    'vivify': [0, 1],
+    'walk': [0, 1],
+    'lucky': [0, 1],
+    'reduceint': [100, 300, 1000],
+}
+
+
+def default_options():
+    """Read CaDiCaL's default value of every option of the search space."""
+    from pycadical import Solver
+
+    solver = Solver()
+    return {name: solver.get_option(name) for name in search_space}
+
+
+def random_configuration(random, defaults):
+    """Select a random value for every option of the search space.
+
+    Args:
+        random: The random number generator to use
+        defaults: CaDiCaL's default options, see ``default_options``
+
+    Returns:
+        A dictionary of the options that differ from the default
+    """
+    options = {}
+    for name, values in search_space.items():
+        default = defaults[name]
+        value = random.choice(
+            [default, *(value for value in values if value != default)])
+        if value != default:
+            options[name] = value
+    return options
+
+
+def save_profile(path, profile):
+    with open(path, 'w') as profile_file:
+        json.dump(profile, profile_file, indent=1)
+
+
+def load_profile(path):
+    """Load a profile written by ``tune_options.py``.
+
+    The options of the profile are found under the ``'options'`` key.
+    """
+    with open(path) as profile_file:
+        return json.load(profile_file)
+
+
+def _evaluate(task):
+    from packing import PackingSolver, DeadlineExceeded
+
+    config_id, options, path, height, max_width, time_limit = task
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        solver = PackingSolver(
+            load_schedule(path), height, max_width, solver_options=options)
+
+        start = time.monotonic()
+        solver.deadline = start + time_limit
+        try:
+            for solution in solver.iter_solutions():
+                pass
+        except DeadlineExceeded:
+            pass
+
+    if solver.lower + 1 >= solver.upper:
+        score = time.monotonic() - start
+    else:
+        score = 2 * time_limit
+
+    return config_id, path, score
+
+
+def tune(
+        directory, height, max_width, configurations=16, budget=3600,
+        time_limit=60, initial_instances=1, processes=None, seed=None):
+    """Search for the best configuration using successive halving.
+
+    Args:
+        directory: Corpus of instances to use
+        height: The fixed height of the packing area
+        max_width: Upper bound on the width of the packing area
+        configurations: Number of configurations to compare, including the
+            default configuration
+        budget: Total time in seconds after which tuning stops
+        time_limit: Time limit in seconds for a single run
+        initial_instances: Number of instances used in the first round
+        processes: Number of worker processes (defaults to the CPU count)
+        seed: Random seed for selecting configurations and instances
+
+    Returns:
+        A ``(options, mean_time, instances)`` tuple for the best configuration
+        or None if the budget didn't suffice to complete the first round.
+    """
+    random = Random(seed)
+
+    defaults = default_options()
+
+    # the default configuration is always included as baseline
+    configs = [{}]
+    seen = {()}
+    for _ in range(100 * configurations):
+        if len(configs) >= configurations:
+            break
+        options = random_configuration(random, defaults)
+        key = tuple(sorted(options.items()))
+        if key not in seen:
+            seen.add(key)
+            configs.append(options)
+
+    paths = [
+        os.path.join(directory, entry['file'])
+        for entry in load_index(directory)
+    ]
+    random.shuffle(paths)
+
+    end = time.monotonic() + budget
+
+    # scores of completed runs by configuration and instance
+    scores = {}
+
+    alive = list(range(len(configs)))
+    used = min(initial_instances, len(paths))
+    ranking = None
+
+    def mean_time(config_id, instances):
+        return sum(
+            scores[config_id, path] for path in paths[:instances]
+        ) / instances
+
+    with multiprocessing.Pool(processes) as pool:
+        while True:
+            tasks = [
+                (config_id, configs[config_id], path,
+                 height, max_width, time_limit)
+                for config_id in alive
+                for path in paths[:used]
+                if (config_id, path) not in scores
+            ]
+
+            results = pool.imap_unordered(_evaluate, tasks)
+            try:
+                for _ in tasks:
+                    remaining = end - time.monotonic()
+                    config_id, path, score = results.next(
+                        timeout=max(remaining, 0))
+                    scores[config_id, path] = score
+            except multiprocessing.TimeoutError:
+                print('time budget exhausted')
+                break
+
+            alive.sort(key=lambda config_id: mean_time(config_id, used))
+            ranking = (alive, used)
+
+            print(f'{len(alive)} configurations on {used} instances:')
+            for config_id in alive:
+                print(
+                    f'  {mean_time(config_id, used):8.2f}s '
+                    f'{configs[config_id]}')
+
+            if len(alive) == 1 or used == len(paths):
+                break
+
+            alive = alive[:max(1, len(alive) // 2)]
+            used = min(2 * used, len(paths))
+
+    if ranking is None:
+        return None
+
+    alive, used = ranking
+    return configs[alive[0]], mean_time(alive[0], used), used
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='tune the SAT solver options for a corpus of instances')
+    parser.add_argument('corpus', type=str,
+                        help='corpus directory (see corpus.py)')
+    parser.add_argument('--height', type=int, required=True,
+                        help='height of the packing area')
+    parser.add_argument('--max-width', type=int, required=True,
+                        help='maximal width of the packing area')
+    parser.add_argument('--configurations', type=int, default=16,
+                        help='number of configurations to compare')
+    parser.add_argument('--budget', type=float, default=3600,
+                        help='total time budget in seconds')
+    parser.add_argument('--time-limit', type=float, default=60,
+                        help='time limit for a single run in seconds')
+    parser.add_argument('--initial-instances', type=int, default=1,
+                        help='number of instances used in the first round')
+    parser.add_argument('--processes', type=int,
+                        help='number of worker processes')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed')
+    parser.add_argument('--name', type=str, default='packing',
+                        help='name of the profile')
+    parser.add_argument('--output', type=str,
+                        help='profile file to write (defaults to '
+                        'profile_{name}.json)')
+
+    args = parser.parse_args()
+
+    result = tune(
+        args.corpus, args.height, args.max_width,
+        configurations=args.configurations,
+        budget=args.budget,
+        time_limit=args.time_limit,
+        initial_instances=args.initial_instances,
+        processes=args.processes,
+        seed=args.seed,
+    )
+
+    if result is None:
+        parser.error('the time budget is too small to compare configurations')
+
+    options, mean_time, instances = result
+
+    output = args.output
+    if output is None:
+        output = f'profile_{args.name}.json'
+
+    save_profile(output, {
+        'name': args.name,
+        'options': options,
+        'mean_time': mean_time,
+        'instances': instances,
+        'corpus': args.corpus,
+        'height': args.height,
+        'max_width': args.max_width,
+    })
+
+    print(f'wrote profile {args.name!r} to {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+"""Independent validation of solution files against their schedule.
+
+Checks that every item is placed exactly once, in one of its orientations,
+within the packing area, during exactly the steps it is scheduled for and
+without overlapping other items. This works for the solution files written by
+``packing.py`` as well as ``packing_ip.py``.
+
+All checks use NumPy arrays of the occupied cells, so validating a solution
+takes time linear in its size. Requires NumPy.
+"""
+import argparse
+import re
+import sys
+
+import numpy as np
+
+from gen_instance import random_instance
+from shapes import well_known_shapes
+from solution import read_solution
+
+
+def placement_cells(schedule, placements):
+    """List all cells occupied by the given placements.
+
+    Returns:
+        Arrays ``(t, i, j, item_id)`` with one entry per occupied cell and
+        time step
+    """
+    item_ids = []
+    rows = []
+    cols = []
+    for item_id, i, j, mask_id in placements:
+        for di, dj in schedule[item_id][2][mask_id]:
+            item_ids.append(item_id)
+            rows.append(i + di)
+            cols.append(j + dj)
+
+    item_ids = np.array(item_ids, dtype=np.int64)
+    rows = np.array(rows, dtype=np.int64)
+    cols = np.array(cols, dtype=np.int64)
+
+    begins = np.array([begin for begin, end, shape in schedule],
+                      dtype=np.int64)[item_ids]
+    ends = np.array([end for begin, end, shape in schedule],
+                    dtype=np.int64)[item_ids]
+
+    # repeat every cell for each step of its item, the step offsets count up
+    # from 0 within each run of repeated cells
+    durations = ends - begins
+    starts = np.repeat(np.cumsum(durations) - durations, durations)
+    steps = np.repeat(begins, durations) + (
+        np.arange(durations.sum()) - starts)
+
+    return (
+        steps, np.repeat(rows, durations), np.repeat(cols, durations),
+        np.repeat(item_ids, durations))
+
+
+def check_placements(schedule, height, width, placements):
+    """Validate placements in a packing area of the given size.
+
+    Returns:
+        A list of error messages, empty for a valid solution
+    """
+    errors = []
+
+    placed_ids = np.array(
+        [item_id for item_id, i, j, mask_id in placements], dtype=np.int64)
+    if placed_ids.size and (
+            placed_ids.min() < 0 or placed_ids.max() >= len(schedule)):
+        return ['placements contain unknown item ids']
+
+    placed = np.bincount(placed_ids, minlength=len(schedule))
+    for item_id in np.flatnonzero(placed != 1):
+        errors.append(f'item {item_id} is placed {placed[item_id]} times')
+
+    for item_id, i, j, mask_id in placements:
+        if not 0 <= mask_id < len(schedule[item_id][2]):
+            return errors + [f'item {item_id} has unknown mask {mask_id}']
+
+    if not placements:
+        return errors
+
+    t, i, j, item_ids = placement_cells(schedule, placements)
+
+    outside = (i < 0) | (i >= height) | (j < 0) | (j >= width)
+    for item_id in np.unique(item_ids[outside]):
+        errors.append(f'item {item_id} is outside of {height}x{width}')
+    if outside.any():
+        return errors
+
+    steps = max(end for begin, end, shape in schedule)
+    used = np.bincount(
+        (t * height + i) * width + j, minlength=steps * height * width)
+    for cell in np.flatnonzero(used > 1)[:10].tolist():
+        step, rest = divmod(cell, height * width)
+        errors.append(
+            f'{used[cell]} items overlap in step {step} at '
+            f'{divmod(rest, width)}')
+
+    return errors
+
+
+def check_grid(schedule, grid, height, width=None):
+    """Validate a solution grid as read from a solution file.
+
+    Args:
+        schedule: The schedule the solution is for
+        grid: For each time step the item ids occupying each cell
+        height: The height of the packing area
+        width: The width reported for the solution, if known
+
+    Returns:
+        A list of error messages, empty for a valid solution
+    """
+    steps = max(end for begin, end, shape in schedule)
+
+    try:
+        occupancy = np.array(grid, dtype=object)
+    except ValueError:
+        return ['grid is not rectangular']
+    if occupancy.ndim != 3:
+        return ['grid is not rectangular']
+
+    grid_steps, grid_height, grid_width = occupancy.shape
+    if grid_steps != steps:
+        return [f'grid has {grid_steps} instead of {steps} steps']
+    if grid_height != height:
+        return [f'grid has height {grid_height} instead of {height}']
+    if width is not None and grid_width != width:
+        return [f'grid has width {grid_width} instead of {width}']
+
+    occupancy[np.equal(occupancy, None)] = -1
+    occupancy = occupancy.astype(np.int64)
+
+    if occupancy.size and (
+            occupancy.min() < -1 or occupancy.max() >= len(schedule)):
+        return ['grid contains unknown item ids']
+
+    # recover the placement of each item from the cells of its first step
+    begins = np.array([begin for begin, end, shape in schedule],
+                      dtype=np.int64)
+    t, i, j = np.nonzero(occupancy >= 0)
+    item_ids = occupancy[t, i, j]
+    first = t == begins[item_ids]
+    order = np.argsort(item_ids[first], kind='stable')
+    item_ids = item_ids[first][order]
+    i = i[first][order]
+    j = j[first][order]
+    bounds = np.searchsorted(item_ids, np.arange(len(schedule) + 1))
+
+    errors = []
+    placements = []
+    for item_id, (begin, end, shape) in enumerate(schedule):
+        lo, hi = bounds[item_id], bounds[item_id + 1]
+        if lo == hi:
+            errors.append(f'item {item_id} is not placed')
+            continue
+        top, left = i[lo:hi].min(), j[lo:hi].min()
+        mask = sorted(zip(i[lo:hi] - top, j[lo:hi] - left))
+        for mask_id, item_mask in enumerate(shape):
+            if sorted(item_mask) == mask:
+                placements.append((item_id, int(top), int(left), mask_id))
+                break
+        else:
+            errors.append(f'item {item_id} has an invalid shape in step '
+                          f'{begin}')
+
+    if errors:
+        return errors
+
+    errors = check_placements(schedule, height, grid_width, placements)
+    if errors:
+        return errors
+
+    # the placements are valid, so the grid has to match them exactly
+    expected = np.full_like(occupancy, -1)
+    t, i, j, item_ids = placement_cells(schedule, placements)
+    expected[t, i, j] = item_ids
+
+    for t, i, j in np.argwhere(expected != occupancy)[:10].tolist():
+        found = occupancy[t, i, j]
+        if found < 0:
+            errors.append(f'item {expected[t, i, j]} is missing in step {t} '
+                          f'at {(i, j)}')
+        else:
+            errors.append(f'unexpected item {found} in step {t} at {(i, j)}')
+
+    return errors
+
+
+def reported_size(file_name):
+    """Size encoded in a solution file name.
+
+    Returns:
+        ``(height, width)`` for ``solution_{height}x{width}.json``, ``(None,
+        width)`` for ``solution_{width}.json`` and ``(None, None)`` otherwise
+    """
+    match = re.search(r'solution_(?:(\d+)x)?(\d+)\.json$', file_name)
+    if match is None:
+        return None, None
+    height, width = match.groups()
+    return None if height is None else int(height), int(width)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='check solution files against their schedule')
+    parser.add_argument('solutions', type=str, nargs='+',
+                        help='solution files to check')
+    parser.add_argument('--height', type=int, required=True,
+                        help='height of the packing area, for solutions '
+                        'of --pareto the upper bound on the height')
+    parser.add_argument('--steps', type=int, help='number of time steps')
+    parser.add_argument('--fill', type=int,
+                        help='limit of blocks present at the same time')
+    parser.add_argument('--duration', type=int,
+                        help='limit of steps an item is present')
+    parser.add_argument('--seed', type=int, nargs='?',
+                        help='random seed for instance generation')
+    parser.add_argument('--schedule', type=str,
+                        help='load the schedule from this file (see '
+                        'corpus.py) instead of generating it')
+
+    args = parser.parse_args()
+
+    if args.schedule is not None:
+        from corpus import load_schedule
+        schedule = load_schedule(args.schedule)
+    else:
+        schedule = random_instance(
+            well_known_shapes,
+            args.steps,
+            args.fill,
+            args.duration,
+            args.seed
+        )
+
+    valid = True
+    for file_name in args.solutions:
+        height, width = reported_size(file_name)
+        if height is None:
+            height = args.height
+        if height > args.height:
+            errors = [f'height {height} exceeds {args.height}']
+        else:
+            errors = check_grid(
+                schedule, read_solution(file_name), height, width)
+        if errors:
+            valid = False
+            print(f'{file_name}: invalid')
+            for error in errors:
+                print(f'  {error}')
+        else:
+            print(f'{file_name}: valid')
+
+    sys.exit(0 if valid else 1)
+
+
+if __name__ == '__main__':
+    main()